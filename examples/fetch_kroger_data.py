@@ -3,12 +3,14 @@ from kroger_app.services.kroger_api import (
     get_access_token,
     fetch_nearest_location,
     fetch_products,
+    iter_products,
 )
 
 __all__ = [
     "get_access_token",
     "fetch_nearest_location",
     "fetch_products",
+    "iter_products",
 ]
 
 if __name__ == "__main__":
@@ -2,21 +2,39 @@ import os
 import logging
 from flask import Flask
 from apscheduler.schedulers.background import BackgroundScheduler
+from .cli import export_history_command
 from .models import db
+from .models.schema import upgrade_schema
+from .storage import (
+    PARTITION_JOB_HOURS,
+    configure_storage,
+    create_schema,
+    init_storage,
+    is_postgres,
+    maintain_history_partitions,
+)
+from .routes.alerts import alerts_bp
 from .routes.products import products_bp
 from .routes.cart import cart_bp
+from .services.cart_queue import CART_QUEUE_SWEEP_SECONDS, cart_write_queue
+from .services.products import monitor_watched_products
+from .services.retention import compact_price_history
+from .services.search import create_search_index
+from .services.watchlist import seed_watchlist
 
 scheduler = BackgroundScheduler()
 
 logger = logging.getLogger(__name__)
 
-# Interval for polling watched products
+# Default interval for polling each watched product
 POLL_INTERVAL_MINUTES = 10
+# How often the scheduler checks the watchlist for due products
+WATCHLIST_TICK_SECONDS = 60
 
 
 def create_app():
     app = Flask(__name__)
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///kroger.db"
+    configure_storage(app)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["SESSION_TYPE"] = "filesystem"
     app.config["SESSION_PERMANENT"] = True
@@ -26,22 +44,107 @@ def create_app():
     app.config["SESSION_COOKIE_HTTPONLY"] = True
     app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 
+    # Number of watched products fetched from Kroger concurrently per poll
+    app.config["POLL_CONCURRENCY"] = int(os.getenv("POLL_CONCURRENCY", 32))
+    app.config["POLL_INTERVAL_MINUTES"] = POLL_INTERVAL_MINUTES
+    # Unpinned intervals adapt to each product's price change rate over the
+    # last POLL_VOLATILITY_DAYS, within these bounds
+    app.config["POLL_ADAPTIVE"] = os.getenv("POLL_ADAPTIVE", "1") not in ("0", "false")
+    app.config["POLL_MIN_INTERVAL_MINUTES"] = int(
+        os.getenv("POLL_MIN_INTERVAL_MINUTES", 5)
+    )
+    app.config["POLL_MAX_INTERVAL_MINUTES"] = int(
+        os.getenv("POLL_MAX_INTERVAL_MINUTES", 24 * 60)
+    )
+    app.config["POLL_VOLATILITY_DAYS"] = int(os.getenv("POLL_VOLATILITY_DAYS", 7))
+    # Upstream product requests per scheduler tick; the default keeps
+    # polling under the 10k/day products quota (0 = no limit)
+    app.config["POLL_REQUEST_BUDGET"] = int(os.getenv("POLL_REQUEST_BUDGET", 6))
+    # Prices are polled at the store nearest this ZIP code
+    app.config["POLL_ZIP_CODE"] = os.getenv("POLL_ZIP_CODE", "45202")
+    # Due watchlist entries claimed per batch, and at most per scheduler tick
+    app.config["WATCHLIST_CLAIM_BATCH"] = int(os.getenv("WATCHLIST_CLAIM_BATCH", 500))
+    app.config["WATCHLIST_MAX_PER_TICK"] = int(
+        os.getenv("WATCHLIST_MAX_PER_TICK", 5000)
+    )
+
+    # Scheduler jobs run only in the process holding their database lease;
+    # another process takes over this long after the holder stops renewing
+    app.config["SCHEDULER_LEASE_SECONDS"] = int(
+        os.getenv("SCHEDULER_LEASE_SECONDS", 3 * WATCHLIST_TICK_SECONDS)
+    )
+
+    # Price history keeps full resolution for HISTORY_RAW_DAYS, then hourly
+    # and, after HISTORY_HOURLY_DAYS, daily lowest/highest prices
+    app.config["HISTORY_RAW_DAYS"] = int(os.getenv("HISTORY_RAW_DAYS", 30))
+    app.config["HISTORY_HOURLY_DAYS"] = int(os.getenv("HISTORY_HOURLY_DAYS", 180))
+    app.config["HISTORY_COMPACT_INTERVAL_MINUTES"] = int(
+        os.getenv("HISTORY_COMPACT_INTERVAL_MINUTES", 60)
+    )
+    # Products compacted per transaction, and at most transactions per run
+    app.config["HISTORY_COMPACT_BATCH"] = int(os.getenv("HISTORY_COMPACT_BATCH", 50))
+    app.config["HISTORY_COMPACT_MAX_BATCHES"] = int(
+        os.getenv("HISTORY_COMPACT_MAX_BATCHES", 40)
+    )
+    # Free SQLite pages returned to the filesystem per run
+    app.config["HISTORY_VACUUM_PAGES"] = int(os.getenv("HISTORY_VACUUM_PAGES", 2000))
+
+    # Product searches with fewer local matches also query the Kroger API
+    app.config["SEARCH_MIN_LOCAL_HITS"] = int(os.getenv("SEARCH_MIN_LOCAL_HITS", 5))
+
+    # "changes" stores one history row per run of identical prices,
+    # "every_poll" stores a row for every poll
+    app.config["PRICE_HISTORY_MODE"] = os.getenv("PRICE_HISTORY_MODE", "changes")
+
     # Defaults to "dev_secret_key" if not found (secure for dev, not for prod!).
     app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev_secret_key")
     db.init_app(app)
+    init_storage(app)
 
     with app.app_context():
-        db.create_all()
+        create_schema()
+        upgrade_schema()
+        create_search_index(app)
+        seed_watchlist()
 
     app.register_blueprint(products_bp)
     app.register_blueprint(cart_bp)
+    app.register_blueprint(alerts_bp)
+    app.cli.add_command(export_history_command)
 
     scheduler.add_job(
         func=lambda: monitor_watched_products(app),
         trigger="interval",
-        minutes=POLL_INTERVAL_MINUTES,
+        seconds=WATCHLIST_TICK_SECONDS,
         id="kroger_watchlist_job",
         replace_existing=True,
     )
 
+    scheduler.add_job(
+        func=lambda: compact_price_history(app),
+        trigger="interval",
+        minutes=app.config["HISTORY_COMPACT_INTERVAL_MINUTES"],
+        id="kroger_compaction_job",
+        replace_existing=True,
+    )
+
+    scheduler.add_job(
+        func=lambda: cart_write_queue.sweep(app),
+        trigger="interval",
+        seconds=CART_QUEUE_SWEEP_SECONDS,
+        id="kroger_cart_queue_job",
+        replace_existing=True,
+    )
+
+    with app.app_context():
+        postgres = is_postgres()
+    if postgres:
+        scheduler.add_job(
+            func=lambda: maintain_history_partitions(app),
+            trigger="interval",
+            hours=PARTITION_JOB_HOURS,
+            id="kroger_partition_job",
+            replace_existing=True,
+        )
+
     return app
@@ -0,0 +1,48 @@
+import sys
+import click
+from flask.cli import with_appcontext
+from .services.export import EXPORT_FORMATS, export_history
+from .services.history import parse_timestamp
+
+
+@click.command("export-history")
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(EXPORT_FORMATS),
+    default="csv",
+    show_default=True,
+)
+@click.option(
+    "--output",
+    "-o",
+    default="-",
+    help="File to write, or - for stdout.",
+    show_default=True,
+)
+@click.option(
+    "--product-id", "product_ids", multiple=True, help="Repeatable; default all."
+)
+@click.option("--since", help="ISO 8601; runs last seen at or after this.")
+@click.option("--until", help="ISO 8601; runs starting before this.")
+@with_appcontext
+def export_history_command(fmt, output, product_ids, since, until):
+    """Stream price history to a CSV, NDJSON or Parquet file."""
+    try:
+        since = parse_timestamp(since) if since else None
+        until = parse_timestamp(until) if until else None
+        pieces = export_history(fmt, list(product_ids), since, until)
+    except (ValueError, RuntimeError) as e:
+        raise click.UsageError(str(e))
+
+    binary = fmt == "parquet"
+    if output == "-":
+        out = sys.stdout.buffer if binary else sys.stdout
+        for piece in pieces:
+            out.write(piece)
+        out.flush()
+        return
+    with open(output, "wb" if binary else "w", newline=None if binary else "") as out:
+        for piece in pieces:
+            out.write(piece)
+    click.echo(f"✅ Exported price history to {output}", err=True)
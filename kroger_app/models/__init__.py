@@ -5,6 +5,26 @@ from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
 from .product import Product
+from .alert_rule import AlertRule
+from .cart_job import CartJob
+from .history_compaction import HistoryCompaction
+from .price_alert import PriceAlert
 from .price_history import PriceHistory
+from .price_rollup import PriceRollup
+from .scheduler_lease import SchedulerLease
+from .store_location import StoreLocation
+from .watchlist import WatchedProduct
 
-__all__ = ["db", "Product", "PriceHistory"]
+__all__ = [
+    "db",
+    "AlertRule",
+    "CartJob",
+    "HistoryCompaction",
+    "Product",
+    "PriceAlert",
+    "PriceHistory",
+    "PriceRollup",
+    "SchedulerLease",
+    "StoreLocation",
+    "WatchedProduct",
+]
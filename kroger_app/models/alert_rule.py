@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+from . import db
+
+
+class AlertRule(db.Model):
+    """A user's price or stock alert condition on one product."""
+
+    __tablename__ = "alert_rules"
+    __table_args__ = (
+        db.Index("ix_alert_rules_product_active", "product_id", "active"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String, nullable=False)
+    # "promo_below", "drop_from_median" or "back_in_stock"
+    rule_type = db.Column(db.String, nullable=False)
+    # Dollars for promo_below, percent for drop_from_median
+    threshold = db.Column(db.Float)
+    # History window for drop_from_median
+    window_days = db.Column(db.Integer, nullable=False, default=30)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    # True while the condition holds, so a rule fires once per episode
+    triggered = db.Column(db.Boolean, nullable=False, default=False)
+    last_triggered_at = db.Column(db.DateTime(timezone=True))
+    created_at = db.Column(
+        db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
@@ -0,0 +1,20 @@
+from . import db
+
+
+class CartJob(db.Model):
+    """A queued cart add, stored so any worker can report or send it."""
+
+    __tablename__ = "cart_jobs"
+
+    id = db.Column(db.String, primary_key=True)
+    # token_key() of the user's access token
+    user_key = db.Column(db.String, nullable=False, index=True)
+    # [{"upc", "modality", "quantity"}, ...]
+    items = db.Column(db.JSON, nullable=False)
+    # "queued", then "sending" while claimed by a flush, then "done" or "failed"
+    status = db.Column(db.String, nullable=False, index=True)
+    # Set on the jobs a flush claimed, so it can find them again
+    claim = db.Column(db.String, index=True)
+    error = db.Column(db.String)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)
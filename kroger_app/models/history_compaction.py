@@ -0,0 +1,16 @@
+from . import db
+
+
+class HistoryCompaction(db.Model):
+    """Progress of price history compaction at one resolution."""
+
+    __tablename__ = "history_compaction"
+
+    # "hour" or "day"
+    resolution = db.Column(db.String, primary_key=True)
+    # History before this has been compacted for every product
+    compacted_until = db.Column(db.DateTime(timezone=True))
+    # The pass in progress compacts up to here, and has done products up to
+    # and including `next_product_id`
+    pass_until = db.Column(db.DateTime(timezone=True))
+    next_product_id = db.Column(db.String)
@@ -0,0 +1,17 @@
+from . import db
+
+
+class PriceAlert(db.Model):
+    """An alert raised when an AlertRule's condition became true."""
+
+    __tablename__ = "price_alerts"
+
+    id = db.Column(db.Integer, primary_key=True)
+    rule_id = db.Column(db.Integer, db.ForeignKey("alert_rules.id"), index=True)
+    product_id = db.Column(db.String, nullable=False)
+    rule_type = db.Column(db.String, nullable=False)
+    promo_price = db.Column(db.Float)
+    # The threshold or median the price was compared against
+    reference_price = db.Column(db.Float)
+    stock_level = db.Column(db.String)
+    triggered_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
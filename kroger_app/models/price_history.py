@@ -2,8 +2,12 @@ from datetime import datetime, timezone
 from . import db
 from .product import Product
 
+
 class PriceHistory(db.Model):
     __tablename__ = "price_history"
+    __table_args__ = (
+        db.Index("ix_price_history_product_timestamp", "product_id", "timestamp"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.String, db.ForeignKey("products.id"), nullable=False)
     timestamp = db.Column(
@@ -11,5 +15,8 @@ class PriceHistory(db.Model):
     )
     promo_price = db.Column(db.Float, nullable=False)
     regular_price = db.Column(db.Float, nullable=False)
+    # A row is a run of identical polls from `timestamp` until `last_seen`
+    last_seen = db.Column(db.DateTime(timezone=True))
+    sample_count = db.Column(db.Integer, default=1)
 
     product = db.relationship("Product", backref="history")
@@ -0,0 +1,32 @@
+from . import db
+
+
+class PriceRollup(db.Model):
+    """Open/high/low/close and running sums of one product's prices per time bucket."""
+
+    __tablename__ = "price_rollups"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "product_id",
+            "resolution",
+            "bucket_start",
+            name="uq_price_rollups_product_resolution_bucket",
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String, db.ForeignKey("products.id"), nullable=False)
+    # "hour", "day" or "week"
+    resolution = db.Column(db.String, nullable=False)
+    bucket_start = db.Column(db.DateTime(timezone=True), nullable=False)
+    promo_open = db.Column(db.Float, nullable=False)
+    promo_high = db.Column(db.Float, nullable=False)
+    promo_low = db.Column(db.Float, nullable=False)
+    promo_close = db.Column(db.Float, nullable=False)
+    promo_sum = db.Column(db.Float, nullable=False)
+    regular_open = db.Column(db.Float, nullable=False)
+    regular_high = db.Column(db.Float, nullable=False)
+    regular_low = db.Column(db.Float, nullable=False)
+    regular_close = db.Column(db.Float, nullable=False)
+    regular_sum = db.Column(db.Float, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
@@ -2,6 +2,10 @@ from . import db
 
 class Product(db.Model):
     __tablename__ = "products"
+    __table_args__ = (
+        db.Index("ix_products_category_id", "category", "id"),
+        db.Index("ix_products_brand_id", "brand", "id"),
+    )
 
     id = db.Column(db.String, primary_key=True)
     name = db.Column(db.String)
@@ -0,0 +1,11 @@
+from . import db
+
+
+class SchedulerLease(db.Model):
+    """Which process may run a scheduled job, until the lease expires."""
+
+    __tablename__ = "scheduler_leases"
+
+    name = db.Column(db.String, primary_key=True)
+    owner = db.Column(db.String, nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False)
@@ -0,0 +1,34 @@
+import logging
+from sqlalchemy import inspect, text
+from . import db
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_schema():
+    """
+    Bring an existing database up to date with the models. `db.create_all()`
+    only creates missing tables, so nullable columns added to a model since
+    its table was created are added here with ALTER TABLE, and missing
+    indexes are created.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(
+                    text(
+                        f'ALTER TABLE "{table.name}" '
+                        f'ADD COLUMN "{column.name}" {col_type}'
+                    )
+                )
+                logger.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
@@ -0,0 +1,13 @@
+from . import db
+
+
+class StoreLocation(db.Model):
+    """Nearest store found for a ZIP code and search radius, cached across restarts."""
+
+    __tablename__ = "store_locations"
+
+    zip_code = db.Column(db.String, primary_key=True)
+    # 0 when the search used the API's default radius
+    radius_miles = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.JSON, nullable=False)
+    fetched_at = db.Column(db.DateTime(timezone=True), nullable=False)
@@ -0,0 +1,16 @@
+from datetime import datetime, timezone
+from . import db
+
+
+class WatchedProduct(db.Model):
+    __tablename__ = "watchlist"
+
+    product_id = db.Column(db.String, primary_key=True)
+    poll_interval_minutes = db.Column(db.Integer, nullable=False)
+    # Set when the interval was chosen explicitly and must not be adapted
+    interval_pinned = db.Column(db.Boolean, default=False)
+    next_due_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+    last_polled_at = db.Column(db.DateTime(timezone=True))
+    created_at = db.Column(
+        db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
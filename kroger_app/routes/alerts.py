@@ -0,0 +1,70 @@
+import logging
+from flask import Blueprint, jsonify, request
+from ..models import AlertRule
+from ..services.alerts import (
+    ALERTS_PAGE_DEFAULT,
+    ALERTS_PAGE_MAX,
+    create_rule,
+    delete_rule,
+    query_alerts,
+    serialize_alert,
+    serialize_rule,
+)
+from ..services.history import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+alerts_bp = Blueprint("alerts", __name__)
+
+
+@alerts_bp.route("/alerts/rules", methods=["GET"])
+def list_alert_rules():
+    query = AlertRule.query
+    if "product_id" in request.args:
+        query = query.filter(AlertRule.product_id == request.args["product_id"])
+    return jsonify([serialize_rule(r) for r in query.order_by(AlertRule.id)]), 200
+
+
+@alerts_bp.route("/alerts/rules", methods=["POST"])
+def add_alert_rule():
+    """
+    Body: {"product_id", "rule_type", "threshold", "window_days"}. rule_type
+    is "promo_below" (threshold in dollars), "drop_from_median" (threshold
+    in percent below the median over window_days, default 30) or
+    "back_in_stock" (no threshold).
+    """
+    data = request.get_json() or {}
+    pid = data.get("product_id")
+    if not pid:
+        return jsonify({"error": "Missing product_id"}), 400
+    try:
+        rule = create_rule(
+            pid, data.get("rule_type"), data.get("threshold"), data.get("window_days")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(serialize_rule(rule)), 201
+
+
+@alerts_bp.route("/alerts/rules/<int:rule_id>", methods=["DELETE"])
+def remove_alert_rule(rule_id):
+    if not delete_rule(rule_id):
+        return jsonify({"error": "Alert rule not found"}), 404
+    return jsonify({"message": f"Deleted alert rule {rule_id}"}), 200
+
+
+@alerts_bp.route("/alerts", methods=["GET"])
+def list_alerts():
+    """Recent alerts, newest first. Query params: product_id, since (ISO 8601), limit."""
+    try:
+        since = request.args.get("since")
+        since = parse_timestamp(since) if since else None
+        limit = int(request.args.get("limit", ALERTS_PAGE_DEFAULT))
+        if limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    alerts = query_alerts(
+        request.args.get("product_id"), since, min(limit, ALERTS_PAGE_MAX)
+    )
+    return jsonify([serialize_alert(a) for a in alerts]), 200
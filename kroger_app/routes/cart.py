@@ -1,8 +1,14 @@
 import os
 import json
 import logging
-from flask import Blueprint, jsonify, request, redirect, session
-from ..services.cart import get_cart, add_to_cart, remove_from_cart
+from flask import Blueprint, jsonify, request, redirect, session, url_for
+from ..services.cart import (
+    get_cart,
+    add_items_to_cart,
+    remove_items_from_cart,
+    valid_quantity,
+)
+from ..services.cart_queue import cart_write_queue
 from ..services.kroger_api import get_access_token
 from ..utils import save_token, get_saved_token
 
@@ -74,6 +80,27 @@ def view_cart():
         return jsonify({"Cart error": str(e)})
 
 
+def _request_items(data, key):
+    """
+    Items from a cart request body: a single object, a list of objects, or
+    {"items": [...]}. Returns None if any item is missing `key`.
+    """
+    if isinstance(data, dict):
+        data = data.get("items", [data])
+    if not isinstance(data, list) or not data:
+        return None
+    if not all(isinstance(item, dict) and key in item for item in data):
+        return None
+    return data
+
+
+def _wants_async(data):
+    flag = request.args.get("async", "")
+    if isinstance(data, dict) and data.get("async"):
+        return True
+    return flag.lower() in ("1", "true", "yes")
+
+
 @cart_bp.route("/cart/add", methods=["PUT"])
 def add_item_to_cart():
     token = session.get("kroger_token") or get_saved_token()
@@ -81,24 +108,41 @@ def add_item_to_cart():
     if not token:
         return jsonify({"error": "Please authenticate first at /auth/login"}), 401
 
-    data = request.get_json()
-    if not data or "upc" not in data:
+    data = request.get_json(silent=True)
+    items = _request_items(data, "upc")
+    if not items:
         return jsonify({"error": "Missing upc"}), 400
+    if not all(valid_quantity(item.get("quantity", 1)) for item in items):
+        return jsonify({"error": "quantity must be a positive integer"}), 400
 
-    # quantity = data.get("quantity", 1)
-    # modality = data.get("modality", "PICKUP")
-    # item_data = {"upc": data["upc"], "quantity": quantity, "modality": modality}
+    if _wants_async(data):
+        job_id = cart_write_queue.enqueue(token, items)
+        status_url = url_for("cart.cart_job_status", job_id=job_id)
+        response = jsonify({"job_id": job_id, "status_url": status_url})
+        response.headers["Location"] = status_url
+        return response, 202
 
     try:
-        logger.info(f"Adding item to cart.")
-        result = add_to_cart(token, data)
-        logger.info("✅ Item added to cart")
+        logger.info(f"Adding {len(items)} item(s) to cart.")
+        result = add_items_to_cart(token, items)
+        logger.info("✅ Item(s) added to cart")
         return jsonify(result), 200
     except Exception as e:
         logger.error(f"Cart error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@cart_bp.route("/cart/jobs/<job_id>", methods=["GET"])
+def cart_job_status(job_id):
+    token = session.get("kroger_token") or get_saved_token()
+    if not token:
+        return jsonify({"error": "Please authenticate first at /auth/login"}), 401
+    status = cart_write_queue.status(token, job_id)
+    if not status:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status), 200
+
+
 @cart_bp.route("/cart/remove", methods=["DELETE"])
 def remove_item_from_cart():
     token = session.get("kroger_token") or get_saved_token()
@@ -107,26 +151,19 @@ def remove_item_from_cart():
     if not token:
         return jsonify({"error": "Please authenticate first at /auth/login"}), 401
 
-    data = request.get_json()
-    if not data or "product_id" not in data:
+    items = _request_items(request.get_json(silent=True), "product_id")
+    if not items:
         return jsonify({"error": "Missing product_id"}), 400
 
+    product_ids = [item["product_id"] for item in items]
     try:
-        try:
-            logger.info("Getting current cart...")
-            cart_response = get_cart(token)
-            if "data" in cart_response and len(cart_response["data"]) > 0:
-                cart_id = cart_response["data"][0]["id"]
-                logger.info(f"Existing cart found with ID: {cart_id}")
-            else:
-                return jsonify({"error": "No cart found"}), 404
-        except Exception as e:
-            logger.error(f"Error getting cart: {str(e)}")
-            return jsonify({"error": "No cart found"}), 404
-        product_id = data["product_id"]
-        logger.info(f"Removing item {product_id} from cart {cart_id}...")
-        result = remove_from_cart(token, cart_id, product_id)
+        logger.info(f"Removing {len(product_ids)} item(s) from cart...")
+        result = remove_items_from_cart(token, product_ids)
+        if len(items) == 1 and result["failed"]:
+            return jsonify({"error": result["failed"][product_ids[0]]}), 500
         return jsonify(result), 200
     except Exception as e:
         logger.error(f"Cart error: {str(e)}")
+        if str(e) == "Cart not found":
+            return jsonify({"error": "No cart found"}), 404
         return jsonify({"error": str(e)}), 500
@@ -1,12 +1,76 @@
+import json
 import logging
-from flask import Blueprint, request, jsonify, current_app
-from ..models import Product, PriceHistory
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+    url_for,
+)
+from ..models import Product, WatchedProduct, db
 from kroger_app.services.products import process_product_data
+from kroger_app.services.export import EXPORT_MIMETYPES, export_history
+from kroger_app.services.history import (
+    decode_cursor,
+    parse_timestamp,
+    query_history,
+    query_samples,
+    serialize_run,
+)
+from kroger_app.services.search import find_products
+from kroger_app.services.rollups import RESOLUTIONS, query_rollups, serialize_rollup
+from kroger_app.services.watchlist import (
+    add_to_watchlist,
+    remove_from_watchlist,
+    serialize_watched_product,
+)
 
 logger = logging.getLogger(__name__)
 
 products_bp = Blueprint("products", __name__)
 
+# Columns /products can return, and those returned when `fields` is not given
+PRODUCT_FIELDS = {
+    "id",
+    "name",
+    "brand",
+    "category",
+    "image_url",
+    "product_url",
+    "regular_price",
+    "promo_price",
+    "stock_level",
+    "size",
+    "sold_by",
+    "temperature_sensitive",
+}
+DEFAULT_PRODUCT_FIELDS = [
+    "id",
+    "name",
+    "brand",
+    "category",
+    "regular_price",
+    "promo_price",
+    "stock_level",
+    "temperature_sensitive",
+]
+
+# Products returned per page by default, and at most
+PRODUCTS_PAGE_DEFAULT = 500
+PRODUCTS_PAGE_MAX = 10000
+# Rows fetched from the database at a time while streaming /products
+PRODUCTS_STREAM_CHUNK = 500
+
+# Search results returned by default, and at most
+SEARCH_LIMIT_DEFAULT = 20
+SEARCH_LIMIT_MAX = 200
+
+# Price history runs returned per page by default, and at most
+HISTORY_PAGE_DEFAULT = 500
+HISTORY_PAGE_MAX = 5000
+
 
 @products_bp.route("/product/watch", methods=["POST"])
 def upsert_product_and_alert():
@@ -21,43 +85,233 @@ def upsert_product_and_alert():
     if not pid:
         return jsonify({"error": "Missing product_id"}), 400
     result = process_product_data(prod_data)
+    add_to_watchlist(pid)
     return jsonify(result), 200
 
 
+@products_bp.route("/watchlist", methods=["GET"])
+def list_watchlist():
+    entries = WatchedProduct.query.order_by(WatchedProduct.next_due_at).all()
+    return jsonify([serialize_watched_product(e) for e in entries]), 200
+
+
+@products_bp.route("/watchlist", methods=["POST"])
+def watch_product():
+    data = request.get_json() or {}
+    pid = data.get("product_id")
+    if not pid:
+        return jsonify({"error": "Missing product_id"}), 400
+    interval = data.get("poll_interval_minutes")
+    if interval is not None and (not isinstance(interval, int) or interval < 1):
+        return (
+            jsonify({"error": "poll_interval_minutes must be a positive integer"}),
+            400,
+        )
+    return jsonify(add_to_watchlist(pid, interval)), 200
+
+
+@products_bp.route("/watchlist/<product_id>", methods=["DELETE"])
+def unwatch_product(product_id):
+    if not remove_from_watchlist(product_id):
+        return jsonify({"error": "Product is not watched"}), 404
+    return jsonify({"message": f"Stopped watching {product_id}"}), 200
+
+
+def _page_limit(default, maximum):
+    limit = int(request.args.get("limit", default))
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+
+def _next_link(cursor):
+    """Link header pointing at the next page, in the same style as the Kroger API."""
+    args = request.args.to_dict()
+    args["cursor"] = cursor
+    return f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+
+
 @products_bp.route("/products", methods=["GET"])
 def list_products():
-    prods = Product.query.all()
-    result = []
-    for p in prods:
-        result.append(
-            {
-                "id": p.id,
-                "name": p.name,
-                "brand": p.brand,
-                "category": p.category,
-                "regular_price": p.regular_price,
-                "promo_price": p.promo_price,
-                "stock_level": p.stock_level,
-                "temperature_sensitive": p.temperature_sensitive,
-            }
-        )
-    return jsonify(result), 200
+    """
+    List stored products ordered by ID, streamed as a JSON array.
+
+    Query params:
+        fields: Comma-separated columns to return (default: the summary fields)
+        category, brand: Exact-match filters
+        limit: Products per page
+        cursor: ID to continue after, taken from the `Link: rel="next"` header
+    """
+    fields = request.args.get("fields")
+    fields = fields.split(",") if fields else DEFAULT_PRODUCT_FIELDS
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    try:
+        limit = _page_limit(PRODUCTS_PAGE_DEFAULT, PRODUCTS_PAGE_MAX)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def filtered(query):
+        if "cursor" in request.args:
+            query = query.filter(Product.id > request.args["cursor"])
+        for name in ("category", "brand"):
+            if name in request.args:
+                query = query.filter(getattr(Product, name) == request.args[name])
+        return query
+
+    # Find the page's last ID up front so the Link header can be sent
+    # before the body starts streaming
+    last_id = (
+        filtered(db.session.query(Product.id))
+        .order_by(Product.id)
+        .offset(limit - 1)
+        .limit(1)
+        .scalar()
+    )
+    has_more = (
+        last_id is not None
+        and filtered(db.session.query(Product.id)).filter(Product.id > last_id).first()
+        is not None
+    )
+
+    columns = [getattr(Product, f) for f in fields]
+    query = filtered(db.session.query(*columns)).order_by(Product.id)
+    if last_id is not None:
+        query = query.filter(Product.id <= last_id)
+
+    def generate():
+        yield "["
+        for n, row in enumerate(
+            query.execution_options(yield_per=PRODUCTS_STREAM_CHUNK)
+        ):
+            yield ("," if n else "") + json.dumps(dict(zip(fields, row)))
+        yield "]"
+
+    response = Response(stream_with_context(generate()), mimetype="application/json")
+    if has_more:
+        response.headers["Link"] = _next_link(last_id)
+    return response
+
+
+@products_bp.route("/products/search", methods=["GET"])
+def search_products():
+    """
+    Search products by name, brand and category, best matches first.
+
+    Stored products are searched first; the Kroger API is only asked when
+    too few match locally, and what it finds is stored. The
+    `X-Search-Source` header says which answered ("local" or "kroger").
+
+    Query params:
+        q: Search term (required)
+        limit: Most products to return
+    """
+    term = request.args.get("q", "").strip()
+    if not term:
+        return jsonify({"error": "Missing search term 'q'"}), 400
+    try:
+        limit = _page_limit(SEARCH_LIMIT_DEFAULT, SEARCH_LIMIT_MAX)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    products, source = find_products(term, limit)
+    response = jsonify(
+        [{f: getattr(p, f) for f in DEFAULT_PRODUCT_FIELDS} for p in products]
+    )
+    response.headers["X-Search-Source"] = source
+    return response
 
 
 @products_bp.route("/product/<product_id>/history", methods=["GET"])
 def get_price_history(product_id):
-    history = (
-        PriceHistory.query.filter_by(product_id=product_id)
-        .order_by(PriceHistory.timestamp.desc())
-        .all()
-    )
-    return jsonify(
-        [
-            {
-                "timestamp": h.timestamp.isoformat(),
-                "promo_price": h.promo_price,
-                "regular_price": h.regular_price,
-            }
-            for h in history
-        ]
+    """
+    Price history, newest first, one entry per poll as rebuilt from the
+    stored runs. Pass `runs=true` to get one entry per run of identical
+    polls instead (`timestamp` to `last_seen`, `samples` polls).
+
+    Query params `since`/`until` (ISO 8601) bound the time range and
+    `limit` the number of entries (polls, or runs) per page. When more
+    remain, the response carries a `Link: <...>; rel="next"` header with
+    a cursor.
+    """
+    try:
+        since = request.args.get("since")
+        since = parse_timestamp(since) if since else None
+        until = request.args.get("until")
+        until = parse_timestamp(until) if until else None
+        limit = _page_limit(HISTORY_PAGE_DEFAULT, HISTORY_PAGE_MAX)
+        cursor = request.args.get("cursor")
+        cursor = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get("runs", "").lower() in ("1", "true", "yes"):
+        runs, next_cursor = query_history(product_id, since, until, limit, cursor)
+        body = [serialize_run(r) for r in runs]
+    else:
+        body, next_cursor = query_samples(product_id, since, until, limit, cursor)
+
+    response = jsonify(body)
+    if next_cursor:
+        response.headers["Link"] = _next_link(next_cursor)
+    return response
+
+
+@products_bp.route("/product/<product_id>/rollup", methods=["GET"])
+def get_price_rollup(product_id):
+    """
+    Open/high/low/close/average prices per hour, day or week, newest first.
+
+    Query params: `resolution` (hour, day or week; default day),
+    `since`/`until` (ISO 8601) and `limit`.
+    """
+    resolution = request.args.get("resolution", "day")
+    if resolution not in RESOLUTIONS:
+        return (
+            jsonify({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}),
+            400,
+        )
+    try:
+        since = request.args.get("since")
+        since = parse_timestamp(since) if since else None
+        until = request.args.get("until")
+        until = parse_timestamp(until) if until else None
+        limit = _page_limit(HISTORY_PAGE_DEFAULT, HISTORY_PAGE_MAX)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    buckets = query_rollups(product_id, resolution, since, until, limit)
+    return jsonify([serialize_rollup(b) for b in buckets])
+
+
+@products_bp.route("/history/export", methods=["GET"])
+def export_price_history():
+    """
+    Stream price history runs for many products as one download, ordered
+    by product and time.
+
+    Query params:
+        format: csv (default), ndjson or parquet (needs pyarrow)
+        product_ids: Comma-separated IDs (default: all products)
+        since, until: ISO 8601 bounds; runs overlapping the range are included
+    """
+    fmt = request.args.get("format", "csv")
+    product_ids = request.args.get("product_ids")
+    product_ids = product_ids.split(",") if product_ids else None
+    try:
+        since = request.args.get("since")
+        since = parse_timestamp(since) if since else None
+        until = request.args.get("until")
+        until = parse_timestamp(until) if until else None
+        body = export_history(fmt, product_ids, since, until)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+
+    response = Response(stream_with_context(body), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers["Content-Disposition"] = (
+        f'attachment; filename="price_history.{fmt}"'
     )
+    return response
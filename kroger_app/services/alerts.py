@@ -0,0 +1,394 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from sqlalchemy import event, func, insert, select, update
+from ..models import AlertRule, PriceAlert, PriceHistory, db
+
+logger = logging.getLogger(__name__)
+
+RULE_TYPES = ("promo_below", "drop_from_median", "back_in_stock")
+OUT_OF_STOCK = "TEMPORARILY_OUT_OF_STOCK"
+DEFAULT_WINDOW_DAYS = 30
+
+# IDs per IN (...) clause when loading history and updating rules
+ALERT_QUERY_CHUNK = 500
+# Alerts returned per page by default, and at most
+ALERTS_PAGE_DEFAULT = 100
+ALERTS_PAGE_MAX = 1000
+# Active rules are cached in memory and reloaded after this many seconds
+RULE_CACHE_TTL_SECONDS = int(os.getenv("ALERT_RULE_CACHE_TTL", 60))
+
+
+class PriceSnapshot:
+    """
+    The prices and stock levels seen in one poll cycle, collected as
+    products are ingested and evaluated against the alert rules in one go.
+    """
+
+    def __init__(self):
+        self.product_ids = []
+        self.promo = []
+        self.regular = []
+        self.stock_level = []
+        self.in_stock = []
+        self.was_out_of_stock = []
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def add(self, product_id, promo, regular, stock_level, previous_stock_level):
+        self.product_ids.append(product_id)
+        self.promo.append(np.nan if promo is None else promo)
+        self.regular.append(np.nan if regular is None else regular)
+        self.stock_level.append(stock_level)
+        self.in_stock.append(stock_level not in (None, OUT_OF_STOCK))
+        self.was_out_of_stock.append(previous_stock_level == OUT_OF_STOCK)
+
+
+def _chunks(ids):
+    for i in range(0, len(ids), ALERT_QUERY_CHUNK):
+        yield ids[i : i + ALERT_QUERY_CHUNK]
+
+
+class _RuleSet:
+    """
+    Active alert rules as parallel arrays, one element per rule. Product IDs
+    and rule types are stored as integer codes so matching a snapshot
+    against the rules needs no string comparisons.
+    """
+
+    def __init__(self, rows):
+        rows = [r for r in rows if r[2] in RULE_TYPES]
+        columns = list(zip(*rows)) or [()] * 6
+        self.id = np.array(columns[0], dtype=np.int64)
+        self.products = {}
+        self.product = np.array(
+            [self.products.setdefault(pid, len(self.products)) for pid in columns[1]],
+            dtype=np.intp,
+        )
+        self.rule_type = np.array(
+            [RULE_TYPES.index(t) for t in columns[2]], dtype=np.intp
+        )
+        self.threshold = np.array(columns[3], dtype=float)
+        self.window_days = np.array(
+            [w or DEFAULT_WINDOW_DAYS for w in columns[4]], dtype=np.int64
+        )
+        self.triggered = np.array(columns[5], dtype=bool)
+
+    def __len__(self):
+        return len(self.id)
+
+
+class _RuleCache:
+    """
+    Keeps the active rules in memory so a poll cycle does not reload every
+    rule from the database. Rules changed through this module invalidate
+    the cache; changes made by other processes are seen within `ttl`.
+    """
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._rules = None
+        self._expires_at = 0.0
+
+    def get(self) -> _RuleSet:
+        with self._lock:
+            if self._rules is None or time.monotonic() >= self._expires_at:
+                rows = (
+                    db.session.connection()
+                    .execute(
+                        select(
+                            AlertRule.id,
+                            AlertRule.product_id,
+                            AlertRule.rule_type,
+                            AlertRule.threshold,
+                            AlertRule.window_days,
+                            AlertRule.triggered,
+                        ).where(AlertRule.active.is_(True))
+                    )
+                    .all()
+                )
+                self._rules = _RuleSet(rows)
+                self._expires_at = time.monotonic() + self._ttl
+            return self._rules
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+
+
+_rule_cache = _RuleCache(RULE_CACHE_TTL_SECONDS)
+
+# Set in session.info when evaluate_rules updated the cached rules ahead of
+# the transaction committing
+RULES_CHANGED_KEY = "alert_rules_changed"
+
+
+@event.listens_for(db.session, "after_commit")
+def _keep_rule_changes(session):
+    session.info.pop(RULES_CHANGED_KEY, None)
+
+
+@event.listens_for(db.session, "after_transaction_end")
+def _drop_uncommitted_rule_changes(session, transaction):
+    # Committed transactions cleared the flag already; anything else rolled
+    # back, so the cache no longer matches the database
+    if transaction.parent is None and session.info.pop(RULES_CHANGED_KEY, None):
+        _rule_cache.invalidate()
+
+
+def weighted_medians(groups, values, weights, n_groups):
+    """
+    Weighted median of `values` per group, without a Python loop.
+
+    Args:
+        groups: Group index (0..n_groups-1) of each value
+        values: Values to take medians of
+        weights: Weight of each value, e.g. a history run's sample count
+        n_groups: Number of groups; groups without values get NaN
+
+    Returns an array of n_groups medians (the lower median on ties).
+    """
+    medians = np.full(n_groups, np.nan)
+    if not len(values):
+        return medians
+    order = np.lexsort((values, groups))
+    groups, values, weights = groups[order], values[order], weights[order]
+    totals = np.bincount(groups, weights=weights, minlength=n_groups)
+    offsets = np.concatenate(([0.0], np.cumsum(totals)[:-1]))
+    within = np.cumsum(weights) - offsets[groups]
+    reached = np.flatnonzero(within >= totals[groups] / 2)
+    found, first = np.unique(groups[reached], return_index=True)
+    medians[found] = values[reached[first]]
+    return medians
+
+
+def _window_medians(product_ids, window_days, now):
+    """Sample-weighted median promo price per product over the last `window_days`."""
+    cutoff = now - timedelta(days=window_days)
+    index = {pid: i for i, pid in enumerate(product_ids)}
+    groups, values, weights = [], [], []
+    for chunk in _chunks(product_ids):
+        rows = db.session.execute(
+            select(
+                PriceHistory.product_id,
+                PriceHistory.promo_price,
+                func.coalesce(PriceHistory.sample_count, 1),
+            ).where(
+                PriceHistory.product_id.in_(chunk),
+                func.coalesce(PriceHistory.last_seen, PriceHistory.timestamp) >= cutoff,
+            )
+        )
+        for pid, promo, count in rows:
+            groups.append(index[pid])
+            values.append(promo)
+            weights.append(count)
+    return weighted_medians(
+        np.array(groups, dtype=np.intp),
+        np.array(values, dtype=float),
+        np.array(weights, dtype=float),
+        len(product_ids),
+    )
+
+
+def _set_triggered(rule_ids, values, returning=False) -> list:
+    """Bulk update rules by ID; with `returning`, only untriggered rules change."""
+    changed = []
+    for chunk in _chunks(rule_ids):
+        stmt = (
+            update(AlertRule)
+            .where(AlertRule.id.in_(chunk))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if returning:
+            stmt = stmt.where(AlertRule.triggered.is_(False)).returning(AlertRule.id)
+            changed.extend(db.session.execute(stmt).scalars())
+        else:
+            db.session.execute(stmt)
+    return changed
+
+
+def evaluate_rules(snapshot: PriceSnapshot, now=None) -> int:
+    """
+    Evaluate every active rule on the snapshot's products and record the
+    alerts that fire.
+
+    Rules come from an in-memory cache and all conditions are evaluated as
+    array operations; history is only queried for drop_from_median rules,
+    once per ALERT_QUERY_CHUNK products and window. A rule fires when its
+    condition becomes true and re-arms once it is false again, so a price
+    that stays low alerts only once. Firing is claimed in the database, so
+    a stale cache or a concurrent evaluation cannot alert twice.
+
+    Runs in the caller's transaction; the caller commits. The cached rules
+    are updated at once and reloaded if that transaction rolls back.
+    Returns the number of alerts written.
+    """
+    if not len(snapshot):
+        return 0
+    started = time.perf_counter()
+    now = now or datetime.now(timezone.utc)
+    rules = _rule_cache.get()
+    ids = np.array(snapshot.product_ids, dtype=str)
+
+    # Position in the snapshot of each rule's product, or -1
+    positions = np.full(len(rules.products), -1, dtype=np.intp)
+    for i, pid in enumerate(snapshot.product_ids):
+        code = rules.products.get(pid)
+        if code is not None:
+            positions[code] = i
+    pos = positions[rules.product]
+    matched = np.flatnonzero(pos >= 0)
+    if not len(matched):
+        return 0
+    pos = pos[matched]
+
+    rule_type = rules.rule_type[matched]
+    threshold = rules.threshold[matched]
+    window = rules.window_days[matched]
+    triggered = rules.triggered[matched]
+    promo = np.array(snapshot.promo, dtype=float)[pos]
+
+    reference = np.full(len(matched), np.nan)
+    below = rule_type == RULE_TYPES.index("promo_below")
+    reference[below] = threshold[below]
+
+    drop = rule_type == RULE_TYPES.index("drop_from_median")
+    for days in np.unique(window[drop]):
+        selected = drop & (window == days)
+        products = np.unique(pos[selected])
+        medians = np.full(len(ids), np.nan)
+        medians[products] = _window_medians(ids[products].tolist(), int(days), now)
+        reference[selected] = medians[pos[selected]] * (1 - threshold[selected] / 100)
+
+    with np.errstate(invalid="ignore"):
+        condition = (below & (promo < reference)) | (drop & (promo <= reference))
+    restock = rule_type == RULE_TYPES.index("back_in_stock")
+    condition |= (
+        restock
+        & np.array(snapshot.in_stock)[pos]
+        & np.array(snapshot.was_out_of_stock)[pos]
+    )
+
+    candidates = np.flatnonzero(condition & ~triggered)
+    rearmed = np.flatnonzero(~condition & triggered)
+    fired_ids = _set_triggered(
+        rules.id[matched[candidates]].tolist(),
+        {"triggered": True, "last_triggered_at": now},
+        returning=True,
+    )
+    _set_triggered(rules.id[matched[rearmed]].tolist(), {"triggered": False})
+    rules.triggered[matched[candidates]] = True
+    rules.triggered[matched[rearmed]] = False
+    if len(candidates) or len(rearmed):
+        db.session.info[RULES_CHANGED_KEY] = True
+
+    if fired_ids:
+        index = dict(zip(rules.id[matched[candidates]].tolist(), candidates))
+        db.session.execute(
+            insert(PriceAlert),
+            [
+                {
+                    "rule_id": rule_id,
+                    "product_id": snapshot.product_ids[pos[i]],
+                    "rule_type": RULE_TYPES[rule_type[i]],
+                    "promo_price": None if np.isnan(promo[i]) else float(promo[i]),
+                    "reference_price": (
+                        None if np.isnan(reference[i]) else float(reference[i])
+                    ),
+                    "stock_level": snapshot.stock_level[pos[i]],
+                    "triggered_at": now,
+                }
+                for rule_id, i in ((r, index[r]) for r in fired_ids)
+            ],
+        )
+    logger.info(
+        f"🔔 {len(fired_ids)} alerts from {len(matched)} rules on {len(snapshot)} "
+        f"products in {(time.perf_counter() - started) * 1000:.1f}ms"
+    )
+    return len(fired_ids)
+
+
+def create_rule(
+    product_id: str, rule_type: str, threshold=None, window_days=None
+) -> AlertRule:
+    if rule_type not in RULE_TYPES:
+        raise ValueError(f"rule_type must be one of {', '.join(RULE_TYPES)}")
+    if rule_type != "back_in_stock":
+        if not isinstance(threshold, (int, float)) or threshold <= 0:
+            raise ValueError("threshold must be a positive number")
+        if rule_type == "drop_from_median" and threshold >= 100:
+            raise ValueError("threshold must be a percentage below 100")
+    if window_days is not None and (
+        not isinstance(window_days, int) or window_days < 1
+    ):
+        raise ValueError("window_days must be a positive integer")
+    rule = AlertRule(
+        product_id=product_id,
+        rule_type=rule_type,
+        threshold=threshold,
+        window_days=window_days or DEFAULT_WINDOW_DAYS,
+    )
+    db.session.add(rule)
+    db.session.commit()
+    _rule_cache.invalidate()
+    logger.info(f"Added {rule_type} alert rule {rule.id} for {product_id}")
+    return rule
+
+
+def delete_rule(rule_id: int) -> bool:
+    rule = db.session.get(AlertRule, rule_id)
+    if not rule:
+        return False
+    PriceAlert.query.filter_by(rule_id=rule_id).delete()
+    db.session.delete(rule)
+    db.session.commit()
+    _rule_cache.invalidate()
+    return True
+
+
+def query_alerts(product_id=None, since=None, limit=ALERTS_PAGE_DEFAULT) -> list:
+    """Recent alerts, newest first."""
+    query = PriceAlert.query
+    if product_id:
+        query = query.filter(PriceAlert.product_id == product_id)
+    if since:
+        query = query.filter(PriceAlert.triggered_at >= since)
+    return (
+        query.order_by(PriceAlert.triggered_at.desc(), PriceAlert.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def serialize_rule(rule: AlertRule) -> dict:
+    return {
+        "id": rule.id,
+        "product_id": rule.product_id,
+        "rule_type": rule.rule_type,
+        "threshold": rule.threshold,
+        "window_days": rule.window_days,
+        "active": rule.active,
+        "triggered": rule.triggered,
+        "last_triggered_at": (
+            rule.last_triggered_at.isoformat() if rule.last_triggered_at else None
+        ),
+    }
+
+
+def serialize_alert(alert: PriceAlert) -> dict:
+    return {
+        "id": alert.id,
+        "rule_id": alert.rule_id,
+        "product_id": alert.product_id,
+        "rule_type": alert.rule_type,
+        "promo_price": alert.promo_price,
+        "reference_price": alert.reference_price,
+        "stock_level": alert.stock_level,
+        "triggered_at": alert.triggered_at.isoformat(),
+    }
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import httpx
+from .http_client import (
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    POOL_MAXSIZE,
+    MAX_RETRIES,
+    _retry_delay,
+)
+from .rate_limiter import endpoint_for, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Connections the async client keeps open; requests beyond this queue for one
+ASYNC_MAX_CONNECTIONS = POOL_MAXSIZE * 5
+
+_client = ContextVar("kroger_async_client", default=None)
+
+
+@asynccontextmanager
+async def client_session():
+    """
+    Open a pooled async client for the enclosed calls. Async Kroger calls
+    made outside a session open a short-lived client of their own.
+    """
+    limits = httpx.Limits(
+        max_connections=ASYNC_MAX_CONNECTIONS,
+        max_keepalive_connections=ASYNC_MAX_CONNECTIONS,
+    )
+    timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        token = _client.set(client)
+        try:
+            yield client
+        finally:
+            _client.reset(token)
+
+
+async def request(method, url, retry_unsafe=False, **kwargs):
+    """
+    Async counterpart of http_client.request, sharing its retry decisions
+    and rate limit budgets.
+    """
+    client = _client.get()
+    if client is None:
+        async with client_session():
+            return await request(method, url, retry_unsafe=retry_unsafe, **kwargs)
+
+    method = method.upper()
+    endpoint = endpoint_for(url)
+
+    for attempt in range(MAX_RETRIES + 1):
+        await rate_limiter.acquire_async(endpoint)
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            sent = not isinstance(e, httpx.ConnectTimeout)
+            delay = _retry_delay(method, endpoint, attempt, retry_unsafe, sent=sent)
+            if delay is None:
+                raise
+        else:
+            delay = _retry_delay(method, endpoint, attempt, retry_unsafe, response)
+            if delay is None:
+                return response
+            await response.aclose()
+
+        logger.warning(
+            f"Retrying {method} {url} in {delay:.2f}s "
+            f"(attempt {attempt + 1}/{MAX_RETRIES})"
+        )
+        await asyncio.sleep(delay)
+
+
+async def get(url, **kwargs):
+    return await request("GET", url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await request("POST", url, **kwargs)
+
+
+async def put(url, **kwargs):
+    return await request("PUT", url, **kwargs)
+
+
+async def delete(url, **kwargs):
+    return await request("DELETE", url, **kwargs)
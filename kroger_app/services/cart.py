@@ -1,10 +1,26 @@
+import hashlib
 import logging
+import threading
 import requests
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from kroger_app.services import http_client
 from kroger_app.utils import handle_kroger_api_response, handle_kroger_request_exception
 
 logger = logging.getLogger(__name__)
 
+CART_URL = "https://api.kroger.com/v1/cart"
+# DELETE requests in flight at once when removing many items
+CART_REMOVE_CONCURRENCY = 8
+
+# Cart ID per user, keyed by a hash of their access token
+_cart_ids = {}
+_cart_ids_lock = threading.Lock()
+
+
+def token_key(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
 
 def get_cart(access_token: str, cart_id: Optional[str] = None) -> Dict:
     """Get the contents of a cart.
@@ -16,20 +32,12 @@ def get_cart(access_token: str, cart_id: Optional[str] = None) -> Dict:
     headers = {"Accept": "application/json", "Authorization": f"Bearer {access_token}"}
 
     try:
-        url = (
-            f"https://api.kroger.com/v1/cart/{cart_id}"
-            if cart_id
-            else "https://api.kroger.com/v1/cart"
-        )
-
-        logger.info(f"Request URL: {url}")
-        logger.info(f"Request Headers: {headers}")
+        url = f"{CART_URL}/{cart_id}" if cart_id else CART_URL
 
-        response = requests.get(url, headers=headers)
-        logger.info(f"Response Status: {response.status_code}")
-        logger.info(f"Response Text: {response.text}")
+        response = http_client.get(url, headers=headers)
+        logger.info(f"Get cart response status: {response.status_code}")
 
-        success = handle_kroger_api_response(response, 204, "Got cart.")["success"]
+        success = handle_kroger_api_response(response, 200, "Got cart.")["success"]
         if success:
             return response.json()
     except requests.exceptions.RequestException as e:
@@ -38,38 +46,69 @@ def get_cart(access_token: str, cart_id: Optional[str] = None) -> Dict:
         raise
 
 
-def add_to_cart(access_token: str, item: Dict) -> Dict:
+def cached_cart_id(access_token: str) -> Optional[str]:
+    with _cart_ids_lock:
+        return _cart_ids.get(token_key(access_token))
+
+
+def remember_cart_id(access_token: str, cart_response: Optional[Dict]):
+    """Cache the cart ID from a get_cart response and return it (None if no cart)."""
+    carts = (cart_response or {}).get("data") or []
+    if not carts:
+        return None
+    cart_id = carts[0]["id"]
+    with _cart_ids_lock:
+        _cart_ids[token_key(access_token)] = cart_id
+    logger.info(f"Existing cart found with ID: {cart_id}")
+    return cart_id
+
+
+def get_cart_id(access_token: str) -> Optional[str]:
+    """Return the user's cart ID, asking Kroger only when it is not cached."""
+    return cached_cart_id(access_token) or remember_cart_id(
+        access_token, get_cart(access_token)
+    )
+
+
+def invalidate_cart_id(access_token: str):
+    with _cart_ids_lock:
+        _cart_ids.pop(token_key(access_token), None)
+
+
+def valid_quantity(quantity) -> bool:
+    """Whether `quantity` is a positive whole number of items."""
+    return isinstance(quantity, int) and not isinstance(quantity, bool) and quantity > 0
+
+
+def cart_add_payload(items: List[Dict]) -> Dict:
+    return {
+        "items": [
+            {
+                "upc": item.get("upc"),
+                "quantity": item.get("quantity", 1),
+                "modality": item.get("modality", "PICKUP"),
+            }
+            for item in items
+        ]
+    }
+
+
+def add_items_to_cart(access_token: str, items: List[Dict]) -> Dict:
     """
-    Add items to the Kroger cart using the /v1/cart/add endpoint.
+    Add many items to the Kroger cart with a single /v1/cart/add request.
     Args:
         access_token: OAuth2 access token
-        item: Item to add, with format:
-            {
-                "upc": "0001111041700",
-                "quantity": 1,
-                "modality": "PICKUP" (optional)
-            }
+        items: Items to add, each in the format accepted by add_to_cart
     """
     headers = {
         "Accept": "application/json",
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json",
     }
-
-    # Need to convert to adding items - missing dependencies
-    formatted_item = [
-        {
-            "upc": item.get("upc"),
-            "quantity": item.get("quantity", 1),
-            "modality": item.get("modality", "PICKUP"),
-        }
-    ]
-    data = {"items": formatted_item}
+    data = cart_add_payload(items)
 
     try:
-        response = requests.put(
-            "https://api.kroger.com/v1/cart/add", headers=headers, json=data
-        )
+        response = http_client.put(f"{CART_URL}/add", headers=headers, json=data)
 
         response = handle_kroger_api_response(response, 204, "Item(s) added to cart.")
         if response["success"]:
@@ -80,6 +119,21 @@ def add_to_cart(access_token: str, item: Dict) -> Dict:
         raise
 
 
+def add_to_cart(access_token: str, item: Dict) -> Dict:
+    """
+    Add items to the Kroger cart using the /v1/cart/add endpoint.
+    Args:
+        access_token: OAuth2 access token
+        item: Item to add, with format:
+            {
+                "upc": "0001111041700",
+                "quantity": 1,
+                "modality": "PICKUP" (optional)
+            }
+    """
+    return add_items_to_cart(access_token, [item])
+
+
 def remove_from_cart(access_token: str, cart_id: str, upc: str) -> Dict:
     """Remove an item from the cart.
 
@@ -91,9 +145,44 @@ def remove_from_cart(access_token: str, cart_id: str, upc: str) -> Dict:
     headers = {"Accept": "application/json", "Authorization": f"Bearer {access_token}"}
 
     try:
-        response = requests.delete(
-            f"https://api.kroger.com/v1/cart/{cart_id}/items/{upc}", headers=headers
+        response = http_client.delete(
+            f"{CART_URL}/{cart_id}/items/{upc}", headers=headers
         )
+        if response.status_code == 404:
+            # The cached cart may be gone; look it up again next time
+            invalidate_cart_id(access_token)
         return handle_kroger_api_response(response)
     except requests.exceptions.RequestException as e:
         handle_kroger_request_exception(e)
+
+
+def remove_items_from_cart(access_token: str, upcs: List[str]) -> Dict:
+    """Remove many items from the user's cart, sending the deletes concurrently.
+
+    Args:
+        access_token: OAuth2 access token
+        upcs: UPCs of the items to remove
+
+    Returns {"removed": [...], "failed": {upc: error}}. Raises if the user
+    has no cart.
+    """
+    cart_id = get_cart_id(access_token)
+    if not cart_id:
+        raise Exception("Cart not found")
+
+    def remove(upc):
+        try:
+            remove_from_cart(access_token, cart_id, upc)
+            return upc, None
+        except Exception as e:
+            return upc, str(e)
+
+    with ThreadPoolExecutor(
+        max_workers=min(CART_REMOVE_CONCURRENCY, len(upcs) or 1)
+    ) as pool:
+        results = list(pool.map(remove, upcs))
+
+    removed = [upc for upc, error in results if error is None]
+    failed = {upc: error for upc, error in results if error is not None}
+    logger.info(f"Removed {len(removed)} of {len(upcs)} items from cart {cart_id}")
+    return {"removed": removed, "failed": failed}
@@ -0,0 +1,212 @@
+import os
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, or_, select, update
+from ..models import CartJob, db
+from ..storage import db_writer
+from .cart import add_items_to_cart, token_key, valid_quantity
+
+logger = logging.getLogger(__name__)
+
+# Adds queued for a user within this many seconds are sent as one request
+CART_QUEUE_WINDOW_SECONDS = float(os.getenv("KROGER_CART_QUEUE_WINDOW", 2.0))
+# Finished jobs can be polled for this long
+CART_JOB_RETENTION_SECONDS = 3600
+# Queued jobs older than this were left by a worker that stopped before its
+# window closed, and are failed by the sweep
+CART_JOB_STALE_SECONDS = 30
+# A job still "sending" after this long was interrupted mid-request
+CART_JOB_SEND_TIMEOUT_SECONDS = 300
+# How often each process sweeps for stale and expired jobs
+CART_QUEUE_SWEEP_SECONDS = 30
+
+
+def _insert_job(job_id, user, items, now):
+    db.session.add(
+        CartJob(
+            id=job_id,
+            user_key=user,
+            items=items,
+            status="queued",
+            created_at=now,
+            updated_at=now,
+        )
+    )
+
+
+def _claim_jobs(user, claim, now) -> list:
+    """
+    Mark the user's queued jobs as "sending" under `claim`, so no other
+    flush picks them up, and return them oldest first.
+    """
+    db.session.execute(
+        update(CartJob)
+        .where(CartJob.user_key == user, CartJob.status == "queued")
+        .values(status="sending", claim=claim, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(
+        select(CartJob.id, CartJob.items)
+        .where(CartJob.claim == claim)
+        .order_by(CartJob.created_at)
+    ).all()
+
+
+def _finish_jobs(claim, status, error, now):
+    db.session.execute(
+        update(CartJob)
+        .where(CartJob.claim == claim)
+        .values(status=status, error=error, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _expire_jobs(now):
+    """Fail interrupted sends and delete finished jobs past their retention."""
+    db.session.execute(
+        update(CartJob)
+        .where(
+            CartJob.status == "sending",
+            CartJob.updated_at < now - timedelta(seconds=CART_JOB_SEND_TIMEOUT_SECONDS),
+        )
+        .values(
+            status="failed",
+            error="Interrupted while sending; the add may not have been applied",
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(CartJob)
+        .where(
+            or_(CartJob.status == "done", CartJob.status == "failed"),
+            CartJob.updated_at < now - timedelta(seconds=CART_JOB_RETENTION_SECONDS),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+class CartWriteQueue:
+    """
+    Per-user queue of cart adds, flushed as one bulk add per window.
+
+    Jobs are stored in the cart_jobs table, so their status can be polled
+    from any worker. Access tokens are only kept in the memory of the
+    worker that queued the adds, which sends the batch when the window
+    closes. Jobs left queued longer than CART_JOB_STALE_SECONDS, because
+    that worker stopped, are failed by the next sweep in any process, or
+    sent if the sweeping worker has the user's token.
+
+    Adds of the same UPC and modality within a window are merged by
+    summing their quantities. Every enqueue gets a job ID whose status
+    moves from "queued" through "sending" to "done" or "failed".
+    """
+
+    def __init__(self, window_seconds=CART_QUEUE_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        # Users with a flush timer running in this process
+        self._pending = set()
+        # user key -> access token, until the user's adds are flushed
+        self._tokens = {}
+
+    def enqueue(self, access_token: str, items) -> str:
+        """Queue adds for the token's user; raises ValueError for a bad quantity."""
+        if not all(valid_quantity(item.get("quantity", 1)) for item in items):
+            raise ValueError("quantity must be a positive integer")
+        user = token_key(access_token)
+        job_id = uuid.uuid4().hex
+        items = [
+            {
+                "upc": item["upc"],
+                "modality": item.get("modality", "PICKUP"),
+                "quantity": item.get("quantity", 1),
+            }
+            for item in items
+        ]
+        now = datetime.now(timezone.utc)
+        db_writer.run(_insert_job, job_id, user, items, now)
+        with self._lock:
+            self._tokens[user] = access_token
+            if user not in self._pending:
+                self._pending.add(user)
+                timer = threading.Timer(self.window_seconds, self._flush, (user,))
+                timer.daemon = True
+                timer.start()
+        return job_id
+
+    def _flush(self, user):
+        with self._lock:
+            self._pending.discard(user)
+            access_token = self._tokens.pop(user, None)
+        try:
+            self.flush_user(user, access_token)
+        except Exception as e:
+            logger.error(f"Error flushing queued cart adds: {e}")
+
+    def flush_user(self, user, access_token):
+        """
+        Send every queued add of `user` as one request, or fail them all
+        when `access_token` is None.
+        """
+        claim = uuid.uuid4().hex
+        jobs = db_writer.run(_claim_jobs, user, claim, datetime.now(timezone.utc))
+        if not jobs:
+            return
+
+        try:
+            if access_token is None:
+                raise RuntimeError(
+                    "The worker that queued this add stopped before sending it"
+                )
+            quantities = {}
+            for _, items in jobs:
+                for item in items:
+                    key = (item["upc"], item["modality"])
+                    quantities[key] = quantities.get(key, 0) + item["quantity"]
+            items = [
+                {"upc": upc, "modality": modality, "quantity": quantity}
+                for (upc, modality), quantity in quantities.items()
+            ]
+            add_items_to_cart(access_token, items)
+            status, error = "done", None
+            logger.info(
+                f"✅ Flushed {len(jobs)} queued cart add(s) as {len(items)} item(s)"
+            )
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.error(f"Queued cart add failed: {e}")
+        db_writer.run(_finish_jobs, claim, status, error, datetime.now(timezone.utc))
+
+    def sweep(self, app):
+        """
+        Scheduled job: fail adds left queued by a worker that stopped and
+        sends that were interrupted, and delete expired jobs.
+        """
+        with app.app_context():
+            now = datetime.now(timezone.utc)
+            db_writer.run(_expire_jobs, now)
+            stale = now - timedelta(seconds=CART_JOB_STALE_SECONDS)
+            users = (
+                db.session.execute(
+                    select(CartJob.user_key)
+                    .where(CartJob.status == "queued", CartJob.created_at < stale)
+                    .distinct()
+                )
+                .scalars()
+                .all()
+            )
+        for user in users:
+            self._flush(user)
+
+    def status(self, access_token: str, job_id: str):
+        """The job's status, or None if it is unknown or belongs to another user."""
+        job = db.session.get(CartJob, job_id)
+        if not job or job.user_key != token_key(access_token):
+            return None
+        return {"job_id": job_id, "status": job.status, "error": job.error}
+
+
+cart_write_queue = CartWriteQueue()
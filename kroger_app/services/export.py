@@ -0,0 +1,166 @@
+import io
+import csv
+import json
+from sqlalchemy import func, select
+from ..models import PriceHistory, db
+
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_COLUMNS = (
+    "product_id",
+    "timestamp",
+    "last_seen",
+    "sample_count",
+    "promo_price",
+    "regular_price",
+)
+# Rows fetched per round trip from the server-side cursor; also the size of
+# each Parquet row group
+EXPORT_CHUNK = 10000
+
+
+def history_chunks(product_ids=None, since=None, until=None, chunk_size=EXPORT_CHUNK):
+    """
+    Yield price history rows as lists of tuples in EXPORT_COLUMNS order,
+    `chunk_size` at a time, ordered by product and time. Timestamps are
+    UTC, naive on SQLite.
+
+    Rows come from a server-side cursor, so memory use doesn't grow with
+    the export. Runs overlapping [since, until) are included: those seen
+    at or after `since` that started before `until`.
+    """
+    query = select(*(getattr(PriceHistory, c) for c in EXPORT_COLUMNS))
+    if product_ids:
+        query = query.where(PriceHistory.product_id.in_(product_ids))
+    if since is not None:
+        # Like query_history, include the run in progress at `since`
+        query = query.where(
+            func.coalesce(PriceHistory.last_seen, PriceHistory.timestamp) >= since
+        )
+    if until is not None:
+        query = query.where(PriceHistory.timestamp < until)
+    query = query.order_by(PriceHistory.product_id, PriceHistory.timestamp)
+
+    # Core execution skips the ORM's per-row bookkeeping
+    result = db.session.connection().execute(
+        query, execution_options={"yield_per": chunk_size}
+    )
+    try:
+        for rows in result.partitions():
+            yield [
+                (pid, ts, last_seen or ts, samples or 1, promo, regular)
+                for pid, ts, last_seen, samples, promo, regular in rows
+            ]
+    finally:
+        result.close()
+
+
+def _isoformat(ts) -> str:
+    # Naive values, as read back from SQLite, are UTC
+    text = ts.isoformat()
+    return text + "+00:00" if ts.tzinfo is None else text
+
+
+def _iso_rows(rows):
+    return [
+        (pid, _isoformat(ts), _isoformat(last_seen), samples, promo, regular)
+        for pid, ts, last_seen, samples, promo, regular in rows
+    ]
+
+
+def export_csv(chunks):
+    """Yield CSV text, a header line then one block per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(_iso_rows(rows))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_ndjson(chunks):
+    """Yield newline-delimited JSON, one block per chunk."""
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in _iso_rows(rows)
+        )
+
+
+class _ByteSink(io.RawIOBase):
+    """Write-only stream that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def export_parquet(chunks):
+    """
+    Yield a Parquet file in pieces, one row group per chunk. Requires
+    pyarrow; raises RuntimeError up front if it isn't installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires pyarrow") from e
+
+    schema = pa.schema(
+        [
+            ("product_id", pa.string()),
+            ("timestamp", pa.timestamp("us", tz="UTC")),
+            ("last_seen", pa.timestamp("us", tz="UTC")),
+            ("sample_count", pa.int32()),
+            ("promo_price", pa.float64()),
+            ("regular_price", pa.float64()),
+        ]
+    )
+
+    def generate():
+        sink = _ByteSink()
+        with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+            for rows in chunks:
+                columns = zip(*rows)
+                writer.write_table(
+                    pa.Table.from_arrays(
+                        [pa.array(col, type=f.type) for col, f in zip(columns, schema)],
+                        schema=schema,
+                    )
+                )
+                yield sink.drain()
+        yield sink.drain()
+
+    return generate()
+
+
+def export_history(fmt, product_ids=None, since=None, until=None):
+    """
+    Stream price history in `fmt` (one of EXPORT_FORMATS), yielding str
+    for text formats and bytes for Parquet.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    chunks = history_chunks(product_ids, since, until)
+    if fmt == "csv":
+        return export_csv(chunks)
+    if fmt == "ndjson":
+        return export_ndjson(chunks)
+    return export_parquet(chunks)
@@ -0,0 +1,154 @@
+import base64
+from datetime import datetime, timezone
+from sqlalchemy import func, or_, and_
+from ..models import PriceHistory, db
+from ..utils import as_utc
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp as UTC; naive values are taken to be UTC."""
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def encode_cursor(timestamp: datetime, row_id: int, skip: int = 0) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}" + (f"|{skip}" if skip else "")
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Return the (timestamp, id, skip) a cursor points at, where `skip` is
+    how many polls of that run were already returned (0 for run cursors).
+    Raises ValueError if malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, row_id, *skip = base64.urlsafe_b64decode(padded).decode().split("|")
+        return parse_timestamp(ts), int(row_id), int(skip[0]) if skip else 0
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def query_history(product_id, since=None, until=None, limit=500, cursor=None):
+    """
+    Fetch one page of a product's price history runs, newest first.
+
+    Runs overlapping [since, until] are returned, reading only the columns
+    needed through the (product_id, timestamp) index. Returns the rows and
+    a cursor for the next page, or None on the last page.
+    """
+    query = db.session.query(
+        PriceHistory.id,
+        PriceHistory.timestamp,
+        PriceHistory.last_seen,
+        PriceHistory.sample_count,
+        PriceHistory.promo_price,
+        PriceHistory.regular_price,
+    ).filter(PriceHistory.product_id == product_id)
+
+    if since is not None:
+        # The run in progress at `since` started at or before it
+        run_start = (
+            db.session.query(func.max(PriceHistory.timestamp))
+            .filter(
+                PriceHistory.product_id == product_id,
+                PriceHistory.timestamp <= since,
+            )
+            .scalar()
+        )
+        query = query.filter(
+            PriceHistory.timestamp >= (run_start or since),
+            func.coalesce(PriceHistory.last_seen, PriceHistory.timestamp) >= since,
+        )
+    if until is not None:
+        query = query.filter(PriceHistory.timestamp <= until)
+    if cursor is not None:
+        cursor_ts, cursor_id = cursor[:2]
+        query = query.filter(
+            or_(
+                PriceHistory.timestamp < cursor_ts,
+                and_(PriceHistory.timestamp == cursor_ts, PriceHistory.id < cursor_id),
+            )
+        )
+
+    rows = (
+        query.order_by(PriceHistory.timestamp.desc(), PriceHistory.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+
+def serialize_run(run) -> dict:
+    """Serialize a price history row as the run of polls it covers."""
+    last_seen = run.last_seen or run.timestamp
+    return {
+        "timestamp": run.timestamp.isoformat(),
+        "last_seen": last_seen.isoformat(),
+        "samples": run.sample_count or 1,
+        "promo_price": run.promo_price,
+        "regular_price": run.regular_price,
+    }
+
+
+def run_polls(run, since=None, until=None, skip=0):
+    """
+    Yield (position, entry) for each poll a run covers, newest first,
+    dropping polls outside [since, until]. Positions count up from the
+    run's first poll; the `skip` newest positions are left out.
+
+    A run only stores its first and last poll times and how many polls it
+    covers, so the polls in between are spaced evenly across that range.
+    """
+    count = run.sample_count or 1
+    first = run.timestamp
+    last = run.last_seen or first
+    step = (last - first) / (count - 1) if count > 1 else None
+    top = count - 1 - skip
+    if until is not None and step:
+        # Start near the newest poll before `until` instead of walking to it
+        top = min(top, int((until - as_utc(first)) / step) + 1)
+    for n in range(top, -1, -1):
+        ts = first + step * n if step else first
+        if until and as_utc(ts) > until:
+            continue
+        if since and as_utc(ts) < since:
+            break
+        yield n, {
+            "timestamp": ts.isoformat(),
+            "promo_price": run.promo_price,
+            "regular_price": run.regular_price,
+        }
+
+
+def query_samples(product_id, since=None, until=None, limit=500, cursor=None):
+    """
+    Fetch one page of per-poll entries rebuilt from a product's runs,
+    newest first. Unlike `query_history`, `limit` counts polls, so one
+    long run is split across pages; the cursor records the run the page
+    stopped in and how many of its polls were returned.
+    """
+    samples = []
+    run_cursor, skip = None, 0
+    if cursor is not None:
+        cursor_ts, cursor_id, skip = cursor
+        # Resume at the cursor's own run, which may be partly returned
+        run_cursor = (cursor_ts, cursor_id + 1)
+    while True:
+        runs, more = query_history(product_id, since, until, limit, run_cursor)
+        for run in runs:
+            count = run.sample_count or 1
+            for n, entry in run_polls(run, since, until, skip):
+                if len(samples) == limit:
+                    return samples, encode_cursor(run.timestamp, run.id, count - 1 - n)
+                samples.append(entry)
+            skip = 0
+        if not more:
+            return samples, None
+        run_cursor = (runs[-1].timestamp, runs[-1].id)
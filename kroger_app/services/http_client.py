@@ -0,0 +1,178 @@
+import os
+import time
+import random
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from .rate_limiter import endpoint_for, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Timeouts (seconds) applied to every outbound call unless overridden
+CONNECT_TIMEOUT = float(os.getenv("KROGER_HTTP_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("KROGER_HTTP_READ_TIMEOUT", 15))
+
+# Keep-alive pool: number of hosts cached, and connections kept per host
+POOL_CONNECTIONS = int(os.getenv("KROGER_HTTP_POOL_CONNECTIONS", 4))
+POOL_MAXSIZE = int(os.getenv("KROGER_HTTP_POOL_MAXSIZE", 20))
+
+# Retry policy
+MAX_RETRIES = int(os.getenv("KROGER_HTTP_MAX_RETRIES", 3))
+BACKOFF_BASE_SECONDS = float(os.getenv("KROGER_HTTP_BACKOFF_BASE", 0.5))
+BACKOFF_MAX_SECONDS = float(os.getenv("KROGER_HTTP_BACKOFF_MAX", 30))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "DELETE"}
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session = _build_session()
+
+
+def _retry_after_seconds(response):
+    """Parse a Retry-After header given either as seconds or an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _backoff_seconds(attempt, retry_after=None):
+    # Full jitter, so that callers retrying together spread out
+    delay = random.uniform(
+        0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+    )
+    if retry_after is not None:
+        delay += min(retry_after, BACKOFF_MAX_SECONDS)
+    return delay
+
+
+def _retry_too_late(endpoint, response, retry_after) -> bool:
+    """
+    True when the server asks for a retry later than BACKOFF_MAX_SECONDS,
+    so the response goes back to the caller instead. A 429 still pauses
+    its endpoint for the full Retry-After.
+    """
+    if retry_after is None or retry_after <= BACKOFF_MAX_SECONDS:
+        return False
+    if response.status_code == 429:
+        rate_limiter.pause(endpoint, retry_after)
+    return True
+
+
+def _should_retry_status(method, status_code, retry_unsafe):
+    if status_code not in RETRY_STATUSES:
+        return False
+    # 429 means the request was rejected before being processed
+    if status_code == 429:
+        return True
+    return retry_unsafe or method in IDEMPOTENT_METHODS
+
+
+def _retry_delay(method, endpoint, attempt, retry_unsafe, response=None, sent=True):
+    """
+    Seconds to wait before retrying attempt number `attempt`, or None when
+    the request is done: the response goes back to the caller or, after a
+    transport error (no `response`), the error is re-raised. `sent` is
+    False when the error happened before the request went out. Shared by
+    the sync and async clients.
+    """
+    last_attempt = attempt == MAX_RETRIES
+    if response is None:
+        # A request that was never sent is safe to retry for any method
+        safe = not sent or retry_unsafe or method in IDEMPOTENT_METHODS
+        if last_attempt or not safe:
+            return None
+        return _backoff_seconds(attempt)
+    if not _should_retry_status(method, response.status_code, retry_unsafe):
+        return None
+    retry_after = _retry_after_seconds(response)
+    if _retry_too_late(endpoint, response, retry_after) or last_attempt:
+        return None
+    delay = _backoff_seconds(attempt, retry_after)
+    if response.status_code == 429:
+        rate_limiter.pause(endpoint, delay)
+    return delay
+
+
+def request(method, url, retry_unsafe=False, timeout=None, **kwargs):
+    """
+    Send a request through the shared keep-alive session, retrying
+    throttled and failed calls with jittered exponential backoff.
+
+    Every attempt first takes a slot from the endpoint's rate limit budget
+    at the caller's priority class; a 429 pauses the whole endpoint for
+    its Retry-After. A Retry-After longer than BACKOFF_MAX_SECONDS is not
+    waited out: that response is returned at once.
+
+    Args:
+        method: HTTP method
+        url: Request URL
+        retry_unsafe: Also retry 5xx and read timeouts for non-idempotent methods
+        timeout: Optional (connect, read) timeout, defaults to the configured timeouts
+        **kwargs: Passed through to requests
+
+    Returns the last response received; callers inspect the status code as
+    they would with requests. Connection errors are re-raised once the
+    retries are used up.
+    """
+    method = method.upper()
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    endpoint = endpoint_for(url)
+
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire(endpoint)
+        try:
+            response = _session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            sent = not isinstance(e, requests.exceptions.ConnectTimeout)
+            delay = _retry_delay(method, endpoint, attempt, retry_unsafe, sent=sent)
+            if delay is None:
+                raise
+        else:
+            delay = _retry_delay(method, endpoint, attempt, retry_unsafe, response)
+            if delay is None:
+                return response
+            response.close()
+
+        logger.warning(
+            f"Retrying {method} {url} in {delay:.2f}s "
+            f"(attempt {attempt + 1}/{MAX_RETRIES})"
+        )
+        time.sleep(delay)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
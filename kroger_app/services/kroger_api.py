@@ -1,8 +1,14 @@
 import os
+import time
 import logging
-import requests
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import base64
 from dotenv import load_dotenv
+from urllib.parse import urlencode
+from . import http_client
+from .response_cache import ResponseCache
 
 load_dotenv()
 
@@ -10,123 +16,403 @@ CLIENT_ID = os.getenv("KROGER_CLIENT_ID")
 CLIENT_SECRET = os.getenv("KROGER_CLIENT_SECRET")
 TOKEN_URL = "https://api.kroger.com/v1/connect/oauth2/token"
 PRODUCTS_URL = "https://api.kroger.com/v1/products"
+LOCATIONS_URL = "https://api.kroger.com/v1/locations"
+# Most products the API returns per page, and product IDs it accepts per filter
+PRODUCTS_PAGE_LIMIT = 50
 
+# Cached client-credentials tokens are treated as expired this many seconds
+# before the upstream expiry, and refreshed in the background once they are
+# within TOKEN_REFRESH_AHEAD_SECONDS of it.
+TOKEN_EXPIRY_MARGIN_SECONDS = int(os.getenv("KROGER_TOKEN_EXPIRY_MARGIN", 60))
+TOKEN_REFRESH_AHEAD_SECONDS = int(os.getenv("KROGER_TOKEN_REFRESH_AHEAD", 300))
+DEFAULT_TOKEN_TTL_SECONDS = 1800
+
+# Product search pages are cached (LRU) for this many seconds unless the
+# upstream Cache-Control says otherwise
+SEARCH_CACHE_SIZE = int(os.getenv("KROGER_SEARCH_CACHE_SIZE", 1024))
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("KROGER_SEARCH_CACHE_TTL", 60))
 
 logger = logging.getLogger(__name__)
 
 
-def get_access_token(auth_code=None, return_full_response=False):
+class _TokenCache:
+    """Thread-safe cache of token responses keyed by (grant_type, scope).
+
+    Only one thread fetches a given key at a time; concurrent callers wait
+    for that fetch and share its result. Tokens close to expiry are still
+    served while a background thread refreshes them.
     """
-    Get access token using either Client Credentials flow (for product API)
-    or Authorization Code flow (for cart API).
 
-    Args:
-        auth_code: Optional authorization code from OAuth2 redirect
-        return_full_response: If True, returns the full response JSON instead of just the token
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._key_locks = {}
+        self._refreshing = set()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _fresh(self, key, now):
+        entry = self._entries.get(key)
+        if entry and now < entry["expires_at"] - TOKEN_EXPIRY_MARGIN_SECONDS:
+            return entry
+        return None
+
+    def _store(self, key, data):
+        ttl = data.get("expires_in") or DEFAULT_TOKEN_TTL_SECONDS
+        self._entries[key] = {
+            "data": data,
+            "expires_at": time.monotonic() + float(ttl),
+        }
+
+    def get(self, key, fetch):
+        entry = self._fresh(key, time.monotonic())
+        if entry:
+            if time.monotonic() >= entry["expires_at"] - TOKEN_REFRESH_AHEAD_SECONDS:
+                self._refresh_in_background(key, fetch)
+            return entry["data"]
+
+        with self._key_lock(key):
+            # Another thread may have fetched while we waited for the lock
+            entry = self._fresh(key, time.monotonic())
+            if entry:
+                return entry["data"]
+            data = fetch()
+            if data.get("access_token"):
+                self._store(key, data)
+            return data
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                with self._key_lock(key):
+                    self._store(key, fetch())
+                logger.info(f"Refreshed cached {key[0]} token ahead of expiry")
+            except Exception as e:
+                # The current token is still valid; the next caller retries
+                logger.warning(f"Background token refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(
+            target=refresh, name="kroger-token-refresh", daemon=True
+        ).start()
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def invalidate_token(self, access_token):
+        """Drop every cached response holding `access_token`."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["data"].get("access_token") == access_token:
+                    del self._entries[key]
+
+
+_token_cache = _TokenCache()
+
+
+def invalidate_token_cache(scope=None, token=None):
+    """
+    Drop cached client-credentials tokens: the one holding `token`, the one
+    for `scope`, or all of them.
+    """
+    if token:
+        _token_cache.invalidate_token(token)
+    else:
+        _token_cache.invalidate(("client_credentials", scope) if scope else None)
+
+
+def _raise_for_status(resp, headers):
+    """
+    Raise for an error response. A 401 means the API rejected the bearer
+    token in `headers`, so a cached copy is dropped and the next
+    get_access_token() fetches a new one instead of reusing it until expiry.
     """
+    if resp.status_code == 401:
+        token = headers.get("Authorization", "")
+        if token.startswith("Bearer "):
+            token = token[len("Bearer ") :]
+        invalidate_token_cache(token=token)
+        logger.warning("⚠️  Access token rejected with 401, dropped from cache")
+    resp.raise_for_status()
+
+
+def _token_request_headers():
+    # Encode client ID and secret for Authorization header
+    auth_str = f"{CLIENT_ID}:{CLIENT_SECRET}"
+    auth_bytes = auth_str.encode("ascii")
+    auth_b64 = base64.b64encode(auth_bytes).decode("ascii")
+
+    return {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Authorization": f"Basic {auth_b64}",
+    }
+
+
+def _token_payload(auth_code, scope):
     if auth_code:
         # Authorization Code flow for cart operations
-        payload = {
+        return {
             "grant_type": "authorization_code",
             "code": auth_code,
             "redirect_uri": os.getenv(
                 "REDIRECT_URI", "http://localhost:5000/auth/callback"
             ),
         }
-    else:
-        # Client Credentials flow for product operations
-        payload = {"grant_type": "client_credentials", "scope": "product.compact"}
+    # Client Credentials flow for product operations
+    return {"grant_type": "client_credentials", "scope": scope}
 
-    try:
-        # Encode client ID and secret for Authorization header
-        auth_str = f"{CLIENT_ID}:{CLIENT_SECRET}"
-        auth_bytes = auth_str.encode("ascii")
-        auth_b64 = base64.b64encode(auth_bytes).decode("ascii")
-
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Authorization": f"Basic {auth_b64}",
-        }
 
-        resp = requests.post(TOKEN_URL, headers=headers, data=payload)
+def _token_response_data(resp):
+    if resp.status_code != 200:
+        error_msg = f"Failed to get token. Status code: {resp.status_code}"
+        try:
+            error_details = resp.json()
+            error_msg += f": {error_details}"
+        except:
+            error_msg += f": {resp.text}"
+        logger.error(error_msg)
+        resp.raise_for_status()
 
-        if resp.status_code != 200:
-            error_msg = f"Failed to get token. Status code: {resp.status_code}"
-            try:
-                error_details = resp.json()
-                error_msg += f": {error_details}"
-            except:
-                error_msg += f": {resp.text}"
-            logger.error(error_msg)
-            resp.raise_for_status()
-
-        response_data = resp.json()
-
-        # If requested, return the full response
-        if return_full_response:
-            return response_data
-
-        token = response_data.get("access_token")
-        if not token:
-            raise ValueError("No access_token in response")
-        logger.info("Obtained access token successfully")
-        return token
+    return resp.json()
+
+
+def _request_token(payload):
+    resp = http_client.post(
+        TOKEN_URL, headers=_token_request_headers(), data=payload, retry_unsafe=True
+    )
+    return _token_response_data(resp)
+
+
+def _token_from_response(response_data, return_full_response):
+    # If requested, return the full response
+    if return_full_response:
+        return dict(response_data)
+
+    token = response_data.get("access_token")
+    if not token:
+        raise ValueError("No access_token in response")
+    logger.info("Obtained access token successfully")
+    return token
+
+
+def get_access_token(
+    auth_code=None, return_full_response=False, scope="product.compact"
+):
+    """
+    Get access token using either Client Credentials flow (for product API)
+    or Authorization Code flow (for cart API).
+
+    Client Credentials tokens are cached per scope and reused until shortly
+    before they expire; Authorization Code exchanges are never cached.
+
+    Args:
+        auth_code: Optional authorization code from OAuth2 redirect
+        return_full_response: If True, returns the full response JSON instead of just the token
+        scope: Scope requested by the Client Credentials flow
+    """
+    try:
+        payload = _token_payload(auth_code, scope)
+        if auth_code:
+            response_data = _request_token(payload)
+        else:
+            response_data = _token_cache.get(
+                ("client_credentials", scope), lambda: _request_token(payload)
+            )
+        return _token_from_response(response_data, return_full_response)
     except Exception as e:
         logger.error(f"Error obtaining token: {str(e)}")
         raise
 
 
-def fetch_nearest_location(token: str, zip_code: str = "45202") -> dict:
-    url = "https://api.kroger.com/v1/locations"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/json",
-    }
+def _location_params(zip_code, radius_miles):
     params = {
         "filter.zipCode.near": zip_code,
         "filter.limit": 1,
     }
-    resp = requests.get(url, headers=headers, params=params)
-    resp.raise_for_status()
+    if radius_miles:
+        params["filter.radiusInMiles"] = radius_miles
+    return params
+
+
+def fetch_nearest_location(
+    token: str, zip_code: str = "45202", radius_miles: int = None
+) -> dict:
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json",
+    }
+    params = _location_params(zip_code, radius_miles)
+    resp = http_client.get(LOCATIONS_URL, headers=headers, params=params)
+    _raise_for_status(resp, headers)
     data = resp.json().get("data", [])
     return data[0] if data else {}
 
 
+_search_cache = ResponseCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL_SECONDS)
+
+
+def _get_products_page(url, headers, params):
+    """GET one page of product search results through the search cache."""
+    key = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+
+    def fetch(etag):
+        if etag:
+            headers_ = dict(headers, **{"If-None-Match": etag})
+        else:
+            headers_ = headers
+        resp = http_client.get(url, headers=headers_, params=params)
+        if resp.status_code != 304:
+            _raise_for_status(resp, headers)
+        return resp
+
+    return _search_cache.get(key, fetch)
+
+
+def _search_url(term, limit, location_id):
+    params = {"filter.term": term, "filter.limit": limit}
+    if location_id:
+        params["filter.locationId"] = location_id
+    return f"{PRODUCTS_URL}?{urlencode(params)}"
+
+
+class ProductStreamError(Exception):
+    """A page of a product stream failed; pass `cursor` to iter_products to resume."""
+
+    def __init__(self, message, cursor):
+        super().__init__(message)
+        self.cursor = cursor
+
+
+def _next_page_url(link):
+    # Parse Link header for next page
+    for part in link.split(","):
+        if 'rel="next"' in part:
+            return part.split(";")[0].strip()[1:-1]
+    return None
+
+
+def iter_products(
+    token: str,
+    term: str = None,
+    limit: int = 50,
+    location_id: str = None,
+    max_items: int = None,
+    pages: bool = False,
+    cursor: str = None,
+    prefetch: bool = True,
+):
+    """
+    Stream products from Kroger page by page, in constant memory.
+
+    Args:
+        token: OAuth2 access token
+        term: Search term
+        limit: Products per page
+        location_id: Optional store to price products at
+        max_items: Stop after this many products
+        pages: Yield each page as a list instead of individual products
+        cursor: Resume from the `cursor` of a ProductStreamError
+        prefetch: Fetch the next page while the caller processes this one
+
+    Raises ProductStreamError when a page cannot be fetched.
+    """
+    headers = {"Authorization": f"Bearer {token}"}
+    url = cursor or _search_url(term, limit, location_id)
+
+    yielded = 0
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # Page fetches keep the caller's context, e.g. its rate limit priority
+        def submit(page_url):
+            context = contextvars.copy_context()
+            return pool.submit(context.run, _get_products_page, page_url, headers, None)
+
+        pending = submit(url)
+        while pending:
+            try:
+                page = pending.result()
+            except Exception as e:
+                raise ProductStreamError(f"Error fetching products: {e}", url) from e
+
+            items = page.data.get("data", [])
+            if max_items is not None:
+                items = items[: max_items - yielded]
+            yielded += len(items)
+            logger.info(f"Fetched {len(items)} items")
+
+            url = _next_page_url(page.link)
+            if url is None or (max_items is not None and yielded >= max_items):
+                url = pending = None
+            elif prefetch:
+                pending = submit(url)
+
+            if pages:
+                yield items
+            else:
+                yield from items
+
+            if url and not prefetch:
+                pending = submit(url)
+
+
 def fetch_products(
     token: str, term: str, limit: int = 50, location_id: str = None
 ) -> list:
     """
     Fetch products from Kroger with pagination.
-    Returns a list of product dicts.
+    Returns a list of product dicts; stops at the first page that fails.
+
+    Pages are served from the search cache when the same search was made
+    recently; the cache key does not include the token.
     """
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"filter.term": term, "filter.limit": limit}
+    products = []
+    try:
+        for page in iter_products(
+            token, term, limit, location_id, pages=True, prefetch=False
+        ):
+            products.extend(page)
+    except ProductStreamError as e:
+        logger.error(str(e))
+
+    return products
+
 
+def _product_ids_params(batch, location_id):
+    params = {"filter.productId": ",".join(batch), "filter.limit": len(batch)}
     if location_id:
         params["filter.locationId"] = location_id
+    return params
 
-    products = []
-    next_url = PRODUCTS_URL
 
-    while next_url:
-        try:
-            resp = requests.get(next_url, headers=headers, params=params)
-            resp.raise_for_status()
-            data = resp.json()
-            page_items = data.get("data", [])
-            products.extend(page_items)
-            logger.info(f"Fetched {len(page_items)} items")
-
-            # Parse Link header for next page
-            link = resp.headers.get("Link", "")
-            next_url = None
-            for part in link.split(","):
-                if 'rel="next"' in part:
-                    next_url = part.split(";")[0].strip()[1:-1]
-                    break
-            params = {}  # only needed on first request
-        except Exception as e:
-            logger.error(f"Error fetching products: {e}")
-            break
+def fetch_products_by_ids(token: str, product_ids, location_id: str = None) -> dict:
+    """
+    Look up many products by ID, sending up to PRODUCTS_PAGE_LIMIT IDs per
+    request. Returns a dict of productId -> product dict; IDs the API does
+    not know are left out. Request errors are raised to the caller.
+    """
+    headers = {"Authorization": f"Bearer {token}"}
+    product_ids = list(dict.fromkeys(product_ids))
+    found = {}
 
-    return products
+    for start in range(0, len(product_ids), PRODUCTS_PAGE_LIMIT):
+        batch = product_ids[start : start + PRODUCTS_PAGE_LIMIT]
+        params = _product_ids_params(batch, location_id)
+        resp = http_client.get(PRODUCTS_URL, headers=headers, params=params)
+        _raise_for_status(resp, headers)
+        for item in resp.json().get("data", []):
+            found[item.get("productId")] = item
+        logger.info(f"Fetched {len(batch)} products by ID")
+
+    return found
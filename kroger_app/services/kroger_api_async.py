@@ -0,0 +1,16 @@
+from . import async_http_client
+from .kroger_api import PRODUCTS_URL, _product_ids_params, _raise_for_status
+
+
+async def fetch_product_batch(token: str, batch, location_id: str = None) -> dict:
+    """
+    Async version of one kroger_api.fetch_products_by_ids request, used by
+    the poller: look up at most PRODUCTS_PAGE_LIMIT product IDs. Returns a
+    dict of productId -> product dict; request errors are raised.
+    """
+    headers = {"Authorization": f"Bearer {token}"}
+    resp = await async_http_client.get(
+        PRODUCTS_URL, headers=headers, params=_product_ids_params(batch, location_id)
+    )
+    _raise_for_status(resp, headers)
+    return {item.get("productId"): item for item in resp.json().get("data", [])}
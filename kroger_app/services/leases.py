@@ -0,0 +1,84 @@
+import os
+import uuid
+import socket
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from ..models import SchedulerLease, db
+
+logger = logging.getLogger(__name__)
+
+# This process's lease owner ID and the PID it was made for
+_owner = (None, None)
+
+# Leases this process held at its last attempt, to log hand-overs
+_held = set()
+
+
+def owner_id() -> str:
+    """
+    Identify this process as a lease owner. Rebuilt after a fork, so
+    workers forked from a preloaded app don't share their parent's ID.
+    """
+    global _owner
+    pid = os.getpid()
+    if _owner[0] != pid:
+        _owner = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}")
+        # The parent's leases aren't this process's
+        _held.clear()
+    return _owner[1]
+
+
+def acquire_lease(name: str, ttl_seconds: float) -> bool:
+    """
+    Take or renew the lease `name` for `ttl_seconds`. Succeeds when this
+    process already holds it or the previous holder let it expire, so at
+    most one process in the fleet holds a lease at a time and another takes
+    over within `ttl_seconds` of the holder dying.
+
+    The check and the takeover are one UPDATE, so racing processes cannot
+    both win. Commits the session.
+    """
+    owner = owner_id()
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    result = db.session.execute(
+        update(SchedulerLease)
+        .where(
+            SchedulerLease.name == name,
+            or_(SchedulerLease.owner == owner, SchedulerLease.expires_at < now),
+        )
+        .values(owner=owner, expires_at=expires_at)
+        .execution_options(synchronize_session=False)
+    )
+    acquired = result.rowcount == 1
+    if not acquired and db.session.get(SchedulerLease, name) is None:
+        db.session.add(SchedulerLease(name=name, owner=owner, expires_at=expires_at))
+        try:
+            db.session.flush()
+            acquired = True
+        except IntegrityError:
+            # Another process created it first
+            db.session.rollback()
+            acquired = False
+    db.session.commit()
+    if acquired and name not in _held:
+        logger.info(f"🔒 {owner} acquired lease {name}")
+        _held.add(name)
+    elif not acquired and name in _held:
+        logger.warning(f"⚠️  {owner} lost lease {name}")
+        _held.discard(name)
+    return acquired
+
+
+def release_lease(name: str) -> None:
+    """Give up the lease `name` if held, so another process can take it at once."""
+    db.session.execute(
+        update(SchedulerLease)
+        .where(SchedulerLease.name == name, SchedulerLease.owner == owner_id())
+        .values(expires_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    _held.discard(name)
@@ -0,0 +1,109 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from ..models import StoreLocation, db
+from ..utils import as_utc
+from .kroger_api import fetch_nearest_location
+from .rate_limiter import current_priority, priority
+
+logger = logging.getLogger(__name__)
+
+# Store locations rarely change, so resolved ZIPs are reused for a day
+LOCATION_TTL_SECONDS = int(os.getenv("KROGER_LOCATION_TTL", 24 * 3600))
+# Location lookups in flight at once when resolving many ZIPs
+LOCATION_LOOKUP_CONCURRENCY = 8
+
+_lock = threading.Lock()
+# (zip_code, radius_miles) -> (location, monotonic expiry)
+_memory = {}
+
+
+def _from_memory(keys) -> dict:
+    now = time.monotonic()
+    found = {}
+    with _lock:
+        for key in keys:
+            entry = _memory.get(key)
+            if entry and entry[1] > now:
+                found[key] = entry[0]
+    return found
+
+
+def _remember(key, location, fetched_at):
+    age = (datetime.now(timezone.utc) - as_utc(fetched_at)).total_seconds()
+    with _lock:
+        _memory[key] = (location, time.monotonic() + LOCATION_TTL_SECONDS - age)
+
+
+def _from_db(keys) -> dict:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=LOCATION_TTL_SECONDS)
+    zips = {zip_code for zip_code, _ in keys}
+    rows = StoreLocation.query.filter(
+        StoreLocation.zip_code.in_(zips), StoreLocation.fetched_at >= cutoff
+    )
+    found = {}
+    for row in rows:
+        key = (row.zip_code, row.radius_miles)
+        if key in keys:
+            found[key] = row.location
+            _remember(key, row.location, row.fetched_at)
+    return found
+
+
+def _save(fetched: dict):
+    now = datetime.now(timezone.utc)
+    for (zip_code, radius), location in fetched.items():
+        db.session.merge(
+            StoreLocation(
+                zip_code=zip_code,
+                radius_miles=radius,
+                location=location,
+                fetched_at=now,
+            )
+        )
+        _remember((zip_code, radius), location, now)
+    db.session.commit()
+
+
+def resolve_locations(token: str, zip_codes, radius_miles: int = None) -> dict:
+    """
+    Resolve the nearest store for many ZIP codes at once.
+
+    Results are cached per ZIP and radius in memory and in the
+    store_locations table for LOCATION_TTL_SECONDS, so only ZIPs missing
+    from both are looked up upstream, concurrently. ZIPs with no nearby
+    store map to an empty dict and are not cached.
+    """
+    radius = radius_miles or 0
+    keys = {(z, radius) for z in zip_codes}
+    found = _from_memory(keys)
+    missing = keys - found.keys()
+    if missing:
+        found.update(_from_db(missing))
+        missing = keys - found.keys()
+
+    if missing:
+        level = current_priority()
+
+        def lookup(key):
+            with priority(level):
+                return key, fetch_nearest_location(token, key[0], radius_miles)
+
+        with ThreadPoolExecutor(
+            max_workers=min(LOCATION_LOOKUP_CONCURRENCY, len(missing))
+        ) as pool:
+            results = pool.map(lookup, missing)
+            fetched = {key: loc for key, loc in results if loc}
+        if fetched:
+            _save(fetched)
+        logger.info(f"Resolved {len(missing)} store locations upstream")
+        found.update(fetched)
+
+    return {zip_code: found.get((zip_code, radius), {}) for zip_code in zip_codes}
+
+
+def resolve_location(token: str, zip_code: str, radius_miles: int = None) -> dict:
+    return resolve_locations(token, [zip_code], radius_miles)[zip_code]
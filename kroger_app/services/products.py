@@ -1,15 +1,40 @@
+import asyncio
 import logging
-from datetime import datetime
+import queue
+import threading
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import func, insert, select, update
 from ..models import Product, PriceHistory, db
+from ..storage import db_writer, insert_history
 from ..services.kroger_api import (
     get_access_token,
-    fetch_nearest_location,
-    fetch_products,
+    PRODUCTS_PAGE_LIMIT,
+)
+from ..services.alerts import PriceSnapshot, evaluate_rules
+from ..services.async_http_client import client_session
+from ..services.kroger_api_async import fetch_product_batch
+from ..services.leases import acquire_lease
+from ..services.locations import resolve_location
+from ..services.rate_limiter import BACKGROUND, priority
+from ..services.rollups import update_rollups
+from ..services.watchlist import (
+    adapt_poll_intervals,
+    claim_due_products,
+    has_due_products,
 )
 
 logger = logging.getLogger(__name__)
 
-WATCHED_IDS = ["0001111041700"]
+# Upstream fetches in flight at once while polling the watchlist
+DEFAULT_POLL_CONCURRENCY = 32
+# Due products claimed from the watchlist per batch, and at most per tick
+DEFAULT_WATCHLIST_CLAIM_BATCH = 500
+DEFAULT_WATCHLIST_MAX_PER_TICK = 5000
+# Only the holder of this lease polls, so each product is polled once per
+# interval however many processes run the scheduler
+WATCHLIST_LEASE = "kroger_watchlist_job"
+DEFAULT_SCHEDULER_LEASE_SECONDS = 180
 
 
 def map_kroger_to_zenday(data: dict) -> dict:
@@ -50,78 +75,322 @@ def map_kroger_to_zenday(data: dict) -> dict:
     }
 
 
-def process_product_data(prod_data):
-    pid = prod_data["id"]
-    new_reg = prod_data["price"]["regular"]
-    new_pr = prod_data["price"]["promo"]
-
-    existing = Product.query.get(pid)
-
-    if existing:
-        old_pr = existing.promo_price or 0
-        new_pr = old_pr - 0.1
-
-        if new_pr is not None and new_pr < old_pr:
-            existing.regular_price = new_reg
-            existing.promo_price = new_pr
-            db.session.add(existing)
-            history = PriceHistory(
-                product_id=pid, promo_price=new_pr, regular_price=new_reg
+# Product IDs per IN (...) clause, well under SQLite's bound-parameter limit
+INGEST_QUERY_CHUNK = 500
+
+
+def _product_row(prod_data, promo_price):
+    return {
+        "id": prod_data["id"],
+        "name": prod_data.get("name"),
+        "brand": prod_data.get("brand"),
+        "category": prod_data.get("category"),
+        "image_url": prod_data.get("image_url"),
+        "product_url": prod_data.get("product_url"),
+        "regular_price": prod_data["price"]["regular"],
+        "promo_price": promo_price,
+        "fulfillment": prod_data.get("fulfillment"),
+        "stock_level": prod_data.get("stock_level"),
+        "size": prod_data.get("size"),
+        "sold_by": prod_data.get("sold_by"),
+        "location": prod_data.get("location"),
+        "dimensions": prod_data.get("dimensions"),
+        "temperature_sensitive": prod_data.get("temperature_sensitive"),
+    }
+
+
+def _latest_runs(ids) -> dict:
+    """Return product ID -> (history id, promo, regular) of each product's latest row."""
+    latest = {}
+    for i in range(0, len(ids), INGEST_QUERY_CHUNK):
+        latest_ids = (
+            select(func.max(PriceHistory.id))
+            .where(PriceHistory.product_id.in_(ids[i : i + INGEST_QUERY_CHUNK]))
+            .group_by(PriceHistory.product_id)
+        )
+        rows = db.session.query(
+            PriceHistory.product_id,
+            PriceHistory.id,
+            PriceHistory.promo_price,
+            PriceHistory.regular_price,
+        ).filter(PriceHistory.id.in_(latest_ids))
+        latest.update({pid: (hid, promo, reg) for pid, hid, promo, reg in rows})
+    return latest
+
+
+def write_products(batch, snapshot: PriceSnapshot = None) -> dict:
+    """
+    Upsert a batch of mapped products and record a price sample for each.
+    Runs in the caller's transaction; the caller commits. Use
+    `ingest_products` unless already running on the database writer.
+
+    Existing rows are loaded with one query per INGEST_QUERY_CHUNK IDs, then
+    products are inserted/updated and history appended with bulk statements.
+    A promo price of 0 or None means no promotion, so the regular price is
+    recorded as the promo price.
+
+    In the default "changes" PRICE_HISTORY_MODE a history row is only added
+    when a product's prices differ from its latest row; otherwise that row's
+    run is extended by bumping `last_seen` and `sample_count`. Every poll is
+    also folded into the hourly/daily/weekly price rollups.
+
+    New prices and stock levels are added to `snapshot` so the caller can
+    evaluate alert rules once per poll cycle. Without one, the rules on
+    this batch's products are evaluated too.
+
+    Returns a dict of product ID -> alert result:
+        {"alert": True, "new_price": ...} for new products,
+        {"alert": True, "old_price": ..., "new_price": ...} for promo drops,
+        {"alert": False} otherwise.
+    """
+    by_id = {p["id"]: p for p in batch}
+    ids = list(by_id)
+    old_promo, old_stock = {}, {}
+    for i in range(0, len(ids), INGEST_QUERY_CHUNK):
+        rows = db.session.query(
+            Product.id, Product.promo_price, Product.stock_level
+        ).filter(Product.id.in_(ids[i : i + INGEST_QUERY_CHUNK]))
+        for pid, promo, stock in rows:
+            old_promo[pid] = promo
+            old_stock[pid] = stock
+
+    changes_only = current_app.config.get("PRICE_HISTORY_MODE") != "every_poll"
+    latest = _latest_runs(ids) if changes_only else {}
+
+    now = datetime.now(timezone.utc)
+    new_rows, updated_rows, history_rows, extended_runs = [], [], [], []
+    results, samples = {}, {}
+    cycle_snapshot = snapshot if snapshot is not None else PriceSnapshot()
+    for pid, prod_data in by_id.items():
+        new_reg = prod_data["price"]["regular"]
+        new_pr = prod_data["price"]["promo"] or new_reg
+        row = _product_row(prod_data, new_pr)
+        samples[pid] = (new_pr, new_reg)
+        cycle_snapshot.add(
+            pid, new_pr, new_reg, prod_data.get("stock_level"), old_stock.get(pid)
+        )
+        run = latest.get(pid)
+        if run and run[1] == new_pr and run[2] == new_reg:
+            extended_runs.append(run[0])
+        else:
+            history_rows.append(
+                {
+                    "product_id": pid,
+                    "timestamp": now,
+                    "last_seen": now,
+                    "sample_count": 1,
+                    "promo_price": new_pr,
+                    "regular_price": new_reg,
+                }
             )
-            db.session.add(history)
-            logger.info(f"✅ Polled prices at {datetime.utcnow().isoformat()}")
-            db.session.commit()
+
+        if pid not in old_promo:
+            new_rows.append(row)
+            logger.info(f"🔔 New product added: {pid} @ promo {new_pr}")
+            results[pid] = {"alert": True, "new_price": new_pr}
+            continue
+
+        updated_rows.append(row)
+        old_pr = old_promo[pid]
+        if old_pr is not None and new_pr is not None and new_pr < old_pr:
             logger.info(f"🔔 Price drop for {pid}: {old_pr} → {new_pr}")
-            return {"alert": True, "old_price": old_pr, "new_price": new_pr}
+            results[pid] = {"alert": True, "old_price": old_pr, "new_price": new_pr}
+        else:
+            results[pid] = {"alert": False}
+
+    if new_rows:
+        db.session.execute(insert(Product), new_rows)
+    if updated_rows:
+        db.session.execute(update(Product), updated_rows)
+    insert_history(history_rows)
+    for i in range(0, len(extended_runs), INGEST_QUERY_CHUNK):
+        db.session.execute(
+            update(PriceHistory)
+            .where(PriceHistory.id.in_(extended_runs[i : i + INGEST_QUERY_CHUNK]))
+            .values(
+                last_seen=now,
+                sample_count=func.coalesce(PriceHistory.sample_count, 1) + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    update_rollups(samples, now)
+    if snapshot is None:
+        evaluate_rules(cycle_snapshot, now)
+    logger.info(f"✅ Polled prices for {len(by_id)} products at {now.isoformat()}")
+    return results
 
-        history = PriceHistory(
-            product_id=pid, promo_price=new_pr, regular_price=new_reg
+
+# Columns refreshed on existing products by `upsert_products`; prices and
+# stock are left to the poller
+DESCRIPTIVE_COLUMNS = (
+    "name",
+    "brand",
+    "category",
+    "image_url",
+    "product_url",
+    "size",
+    "sold_by",
+    "location",
+    "dimensions",
+    "temperature_sensitive",
+)
+
+
+def upsert_products(batch) -> list:
+    """
+    Store a batch of mapped products without recording price samples, for
+    data that isn't a fresh poll (e.g. cached search results). New products
+    are inserted whole; existing ones only get their descriptive columns
+    updated, so history, rollups and alerts only see polled prices. Runs in
+    the caller's transaction; the caller commits. Returns the new IDs.
+    """
+    by_id = {p["id"]: p for p in batch}
+    ids = list(by_id)
+    existing = set()
+    for i in range(0, len(ids), INGEST_QUERY_CHUNK):
+        existing.update(
+            db.session.execute(
+                select(Product.id).where(
+                    Product.id.in_(ids[i : i + INGEST_QUERY_CHUNK])
+                )
+            ).scalars()
         )
-        db.session.add(history)
-        logger.info(f"✅ Polled prices at {datetime.utcnow().isoformat()}")
-        db.session.commit()
-        return {"alert": False}
-
-    new_p = Product(
-        id=pid,
-        name=prod_data.get("name"),
-        brand=prod_data.get("brand"),
-        category=prod_data.get("category"),
-        image_url=prod_data.get("image_url"),
-        product_url=prod_data.get("product_url"),
-        regular_price=new_reg,
-        promo_price=new_pr,
-        fulfillment=prod_data.get("fulfillment"),
-        stock_level=prod_data.get("stock_level"),
-        size=prod_data.get("size"),
-        sold_by=prod_data.get("sold_by"),
-        location=prod_data.get("location"),
-        dimensions=prod_data.get("dimensions"),
-        temperature_sensitive=prod_data.get("temperature_sensitive"),
-    )
-    db.session.add(new_p)
-    logger.info(f"🔔 New product added: {pid} @ promo {new_pr}")
-
-    history = PriceHistory(product_id=pid, promo_price=new_pr, regular_price=new_reg)
-    db.session.add(history)
-    logger.info(f"✅ Polled prices at {datetime.utcnow().isoformat()}")
-    db.session.commit()
-    return {"alert": True, "new_price": new_pr}
+
+    new_rows, updated_rows = [], []
+    for pid, prod_data in by_id.items():
+        regular = prod_data["price"]["regular"]
+        row = _product_row(prod_data, prod_data["price"]["promo"] or regular)
+        if pid in existing:
+            updated_rows.append({"id": pid, **{c: row[c] for c in DESCRIPTIVE_COLUMNS}})
+        else:
+            new_rows.append(row)
+    if new_rows:
+        db.session.execute(insert(Product), new_rows)
+    if updated_rows:
+        db.session.execute(update(Product), updated_rows)
+    return [row["id"] for row in new_rows]
+
+
+def ingest_products(batch, snapshot: PriceSnapshot = None) -> dict:
+    """
+    Write a batch with `write_products` on the database writer thread,
+    committed together with any other writes queued alongside it. Blocks
+    until committed and returns its alert results.
+    """
+    return db_writer.run(write_products, batch, snapshot)
+
+
+def process_product_data(prod_data):
+    return ingest_products([prod_data])[prod_data["id"]]
+
+
+def _poll_products(product_ids, token, loc_id, concurrency, snapshot):
+    """
+    Fetch the products in batches on an asyncio event loop running in a
+    helper thread, with at most `concurrency` requests in flight, while
+    this thread hands each batch to the database writer as it arrives.
+    Returns once every batch is committed.
+    """
+    batches = [
+        product_ids[i : i + PRODUCTS_PAGE_LIMIT]
+        for i in range(0, len(product_ids), PRODUCTS_PAGE_LIMIT)
+    ]
+    results = queue.Queue()
+
+    async def fetch_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(batch):
+            async with semaphore:
+                try:
+                    found = await fetch_product_batch(token, batch, loc_id)
+                    results.put((batch, found, None))
+                except Exception as e:
+                    results.put((batch, None, e))
+
+        with priority(BACKGROUND):
+            async with client_session():
+                await asyncio.gather(*(fetch(batch) for batch in batches))
+
+    def run():
+        try:
+            asyncio.run(fetch_all())
+        finally:
+            results.put(None)
+
+    threading.Thread(target=run, name="kroger-poll", daemon=True).start()
+    writes = []
+    while (result := results.get()) is not None:
+        batch, found, error = result
+        if error:
+            logger.error(f"Error polling watched products: {error}")
+            continue
+        mapped = []
+        for pid in batch:
+            raw = found.get(pid)
+            if not raw:
+                logger.warning(f"⚠️  No data for {pid}")
+                continue
+            mapped.append(map_kroger_to_zenday(raw))
+        if mapped:
+            writes.append(db_writer.submit(write_products, mapped, snapshot))
+    for write in writes:
+        try:
+            write.result()
+        except Exception as e:
+            logger.error(f"Error saving polled products: {e}")
 
 
 def monitor_watched_products(app):
-    with app.app_context():
+    """
+    Poll the watched products that are due. Due products are claimed from
+    the watchlist in bounded batches, and each batch is fetched by the async
+    client while results are written by the database writer thread. Alert
+    rules are evaluated once, over every price seen in the tick.
+
+    Only the process holding the WATCHLIST_LEASE polls; it renews the lease
+    before each batch and stops if it has lost it.
+
+    At most POLL_REQUEST_BUDGET upstream requests are made per tick; due
+    products left over stay due and are claimed first next tick. Polled
+    products then get a poll interval adapted to their price volatility.
+    """
+    with app.app_context(), priority(BACKGROUND):
+        lease_seconds = app.config.get(
+            "SCHEDULER_LEASE_SECONDS", DEFAULT_SCHEDULER_LEASE_SECONDS
+        )
+        if not acquire_lease(WATCHLIST_LEASE, lease_seconds):
+            return
+        if not has_due_products():
+            return
+        concurrency = app.config.get("POLL_CONCURRENCY", DEFAULT_POLL_CONCURRENCY)
+        claim_batch = app.config.get(
+            "WATCHLIST_CLAIM_BATCH", DEFAULT_WATCHLIST_CLAIM_BATCH
+        )
+        max_per_tick = app.config.get(
+            "WATCHLIST_MAX_PER_TICK", DEFAULT_WATCHLIST_MAX_PER_TICK
+        )
+        budget = app.config.get("POLL_REQUEST_BUDGET")
+        if budget:
+            max_per_tick = min(max_per_tick, budget * PRODUCTS_PAGE_LIMIT)
+
         token = get_access_token()
-        loc = fetch_nearest_location(token, zip_code="45202")
+        loc = resolve_location(token, app.config.get("POLL_ZIP_CODE", "45202"))
         loc_id = loc.get("locationId")
         if not loc_id:
             logger.warning("⚠️  No Kroger location found")
             return
-        for pid in WATCHED_IDS:
-            items = fetch_products(token, term=pid, limit=5, location_id=loc_id)
-            raw = next((i for i in items if i.get("productId") == pid), None)
-            if not raw:
-                logger.warning(f"⚠️  No data for {pid}")
-                continue
-            prod_data = map_kroger_to_zenday(raw)
-            process_product_data(prod_data)
+
+        polled = 0
+        snapshot = PriceSnapshot()
+        while polled < max_per_tick:
+            if polled and not acquire_lease(WATCHLIST_LEASE, lease_seconds):
+                break
+            due = claim_due_products(min(claim_batch, max_per_tick - polled))
+            if not due:
+                break
+            _poll_products(due, token, loc_id, concurrency, snapshot)
+            adapt_poll_intervals(due)
+            polled += len(due)
+        db_writer.run(evaluate_rules, snapshot)
+        logger.info(f"✅ Polled {polled} watched products")
@@ -0,0 +1,217 @@
+import os
+import time
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Priority classes; lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Budgets per Kroger endpoint as (requests per second, burst). The defaults
+# spread the published daily quotas evenly over the day. Override with
+# KROGER_RATE_LIMITS="products=0.5:50,cart=0.2:20".
+DEFAULT_BUDGETS = {
+    "products": (10000 / 86400, 100),
+    "locations": (1600 / 86400, 20),
+    "cart": (5000 / 86400, 50),
+    "token": (1.0, 10),
+}
+# Background callers leave this share of each burst for interactive callers
+BACKGROUND_RESERVE = float(os.getenv("KROGER_RATE_BACKGROUND_RESERVE", 0.2))
+# Longest an interactive caller waits for a slot before giving up
+INTERACTIVE_MAX_WAIT_SECONDS = float(os.getenv("KROGER_RATE_INTERACTIVE_MAX_WAIT", 30))
+
+_priority = ContextVar("kroger_request_priority", default=INTERACTIVE)
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+def _parse_budgets(spec):
+    budgets = dict(DEFAULT_BUDGETS)
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        name, _, value = part.partition("=")
+        rate, _, burst = value.partition(":")
+        budgets[name.strip()] = (float(rate), float(burst or rate))
+    return budgets
+
+
+@contextmanager
+def priority(level):
+    """Run the enclosed Kroger API calls at the given priority class."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class _Bucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # Queued callers as (priority class, arrival), and how to wake the
+        # ones waiting on an event loop
+        self.waiters = []
+        self.wakeups = {}
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """
+    Token buckets per endpoint, shared by every outbound Kroger call.
+
+    Callers that find a bucket empty wait in a queue ordered by priority
+    class, then arrival. Background callers also leave a reserve of each
+    bucket untouched, so interactive calls are not starved by polling.
+    """
+
+    def __init__(self, budgets):
+        self._cond = threading.Condition()
+        self._buckets = {name: _Bucket(*b) for name, b in budgets.items()}
+        self._seq = itertools.count()
+
+    def _wait_or_take(self, bucket, waiter, needed):
+        """
+        Take a slot if `waiter` is first in line and one is free, returning
+        None; otherwise return how long to wait. Call holding the lock.
+        """
+        now = time.monotonic()
+        bucket.refill(now)
+        if (
+            bucket.waiters[0] == waiter
+            and now >= bucket.paused_until
+            and bucket.tokens >= min(needed, bucket.burst)
+        ):
+            bucket.tokens -= 1
+            return None
+        return max(
+            bucket.paused_until - now,
+            (min(needed, bucket.burst) - bucket.tokens) / bucket.rate,
+            0.01,
+        )
+
+    def _leave(self, bucket, waiter):
+        """Drop `waiter` from the queue and wake the rest. Call holding the lock."""
+        bucket.waiters.remove(waiter)
+        heapq.heapify(bucket.waiters)
+        bucket.wakeups.pop(waiter, None)
+        self._cond.notify_all()
+        for wake in bucket.wakeups.values():
+            wake()
+
+    def _limits(self, bucket, level, timeout):
+        level = current_priority() if level is None else level
+        if timeout is None and level == INTERACTIVE:
+            timeout = INTERACTIVE_MAX_WAIT_SECONDS
+        deadline = None if timeout is None else time.monotonic() + timeout
+        needed = 1 + (bucket.burst * BACKGROUND_RESERVE if level > INTERACTIVE else 0)
+        return level, deadline, needed
+
+    def acquire(self, endpoint, level=None, timeout=None):
+        """
+        Wait for a request slot on `endpoint`. Endpoints without a budget
+        are not limited. Raises RateLimitExceeded after `timeout` seconds.
+        """
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            return
+        level, deadline, needed = self._limits(bucket, level, timeout)
+
+        with self._cond:
+            waiter = (level, next(self._seq))
+            heapq.heappush(bucket.waiters, waiter)
+            try:
+                while True:
+                    wait = self._wait_or_take(bucket, waiter, needed)
+                    if wait is None:
+                        return
+                    if deadline is not None:
+                        now = time.monotonic()
+                        if now >= deadline:
+                            raise RateLimitExceeded(
+                                f"Kroger API budget for {endpoint} exhausted"
+                            )
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._leave(bucket, waiter)
+
+    async def acquire_async(self, endpoint, level=None, timeout=None):
+        """
+        Like acquire(), but waits on the event loop instead of blocking a
+        thread. Coroutines and threads queue together, by priority class
+        then arrival.
+        """
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            return
+        level, deadline, needed = self._limits(bucket, level, timeout)
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+
+        with self._cond:
+            waiter = (level, next(self._seq))
+            heapq.heappush(bucket.waiters, waiter)
+            # Called from whichever thread leaves the queue
+            bucket.wakeups[waiter] = lambda: loop.call_soon_threadsafe(woken.set)
+        try:
+            while True:
+                with self._cond:
+                    woken.clear()
+                    wait = self._wait_or_take(bucket, waiter, needed)
+                if wait is None:
+                    return
+                if deadline is not None:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        raise RateLimitExceeded(
+                            f"Kroger API budget for {endpoint} exhausted"
+                        )
+                    wait = min(wait, deadline - now)
+                try:
+                    await asyncio.wait_for(woken.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._leave(bucket, waiter)
+
+    def pause(self, endpoint, seconds):
+        """Hold back every caller of `endpoint`, e.g. after a 429 with Retry-After."""
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            return
+        with self._cond:
+            bucket.paused_until = max(bucket.paused_until, time.monotonic() + seconds)
+            bucket.tokens = 0
+        logger.warning(f"Pausing Kroger {endpoint} calls for {seconds:.1f}s")
+
+
+def endpoint_for(url: str) -> str:
+    """Budget name for a Kroger API URL, e.g. .../v1/products?x -> "products"."""
+    path = url.split("://", 1)[-1].split("?", 1)[0]
+    segments = path.split("/")
+    name = segments[2] if len(segments) > 2 and segments[1] == "v1" else ""
+    return "token" if name == "connect" else name
+
+
+rate_limiter = RateLimiter(_parse_budgets(os.getenv("KROGER_RATE_LIMITS")))
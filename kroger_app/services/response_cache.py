@@ -0,0 +1,114 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse:
+    """The parts of an upstream JSON response worth keeping."""
+
+    def __init__(self, data, headers, ttl):
+        self.data = data
+        self.link = headers.get("Link", "")
+        self.etag = headers.get("ETag")
+        self.expires_at = time.monotonic() + ttl
+
+
+def _cache_ttl(headers, default_ttl):
+    """
+    Seconds a response may be reused for according to its Cache-Control
+    header, or None if it must not be stored.
+    """
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        # Stored only so it can be revalidated with its ETag
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if match:
+        return int(match.group(1))
+    return default_ttl
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of upstream GET responses.
+
+    Entries live for their Cache-Control max-age, or `default_ttl` seconds
+    when the upstream does not say. Expired entries that carry an ETag are
+    revalidated with If-None-Match rather than refetched. Concurrent misses
+    on the same key share a single upstream request.
+    """
+
+    def __init__(self, max_entries, default_ttl):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def get(self, key, fetch):
+        """
+        Return the cached response for `key`, calling `fetch(etag)` on a miss.
+
+        `fetch` receives the stale entry's ETag (or None) and must return a
+        requests response with status 200 or 304; anything else should be
+        raised as an exception, which is passed to every waiting caller.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._refresh(key, entry, fetch)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh(self, key, entry, fetch):
+        return self.apply(key, entry, fetch(entry.etag if entry else None))
+
+    def apply(self, key, entry, resp):
+        """Store a fetched 200 or 304 response for `key` and return the entry to use."""
+        ttl = _cache_ttl(resp.headers, self.default_ttl)
+        if resp.status_code == 304 and entry:
+            entry.expires_at = time.monotonic() + (ttl or 0)
+            result = entry
+        else:
+            result = CachedResponse(resp.json(), resp.headers, ttl or 0)
+        if ttl is not None:
+            self._store(key, result)
+        else:
+            with self._lock:
+                self._entries.pop(key, None)
+        return result
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,250 @@
+import logging
+import itertools
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, select, update
+from ..models import HistoryCompaction, PriceHistory, Product, db
+from ..storage import db_writer
+from ..utils import as_utc
+from .leases import acquire_lease
+from .products import _latest_runs
+from .rollups import bucket_start
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_LEASE = "kroger_compaction_job"
+DEFAULT_HISTORY_COMPACT_INTERVAL_MINUTES = 60
+# Full resolution is kept this long, then hourly representatives until
+# DEFAULT_HISTORY_HOURLY_DAYS, then daily ones
+DEFAULT_HISTORY_RAW_DAYS = 30
+DEFAULT_HISTORY_HOURLY_DAYS = 180
+# Products compacted per transaction, and transactions per run
+DEFAULT_HISTORY_COMPACT_BATCH = 50
+DEFAULT_HISTORY_COMPACT_MAX_BATCHES = 40
+# Free pages SQLite returns to the filesystem per run
+DEFAULT_HISTORY_VACUUM_PAGES = 2000
+# Row IDs per IN (...) clause when deleting
+COMPACT_DELETE_CHUNK = 500
+# PRAGMA auto_vacuum value of databases using incremental vacuum
+SQLITE_AUTO_VACUUM_INCREMENTAL = 2
+
+
+# Length of each compaction bucket
+BUCKET_LENGTHS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+def _compact_bucket(rows, bucket_end, protected=()):
+    """
+    Reduce one product's rows in one bucket to the rows holding its lowest
+    and highest promo and regular prices. Rows in `protected` (the
+    product's latest run) and runs that continue past `bucket_end` are
+    always kept, so current prices and runs in progress stay intact.
+
+    Each dropped row's samples are folded into the kept row before it (or
+    the first kept row), so sample counts are preserved. A kept row
+    extends over the rows it absorbed, but never past `bucket_end`.
+
+    Returns the IDs to delete and {kept ID: (sample_count, last_seen)}.
+    """
+    keep = {
+        min(rows, key=lambda r: r.promo_price).id,
+        max(rows, key=lambda r: r.promo_price).id,
+        min(rows, key=lambda r: r.regular_price).id,
+        max(rows, key=lambda r: r.regular_price).id,
+    }
+    keep.update(
+        r.id
+        for r in rows
+        if r.id in protected or as_utc(r.last_seen or r.timestamp) > bucket_end
+    )
+    if len(keep) == len(rows):
+        return [], {}
+    totals = {
+        r.id: (r.sample_count or 1, as_utc(r.last_seen or r.timestamp))
+        for r in rows
+        if r.id in keep
+    }
+    absorbed = set()
+    owner = next(r.id for r in rows if r.id in keep)
+    for r in rows:
+        if r.id in keep:
+            owner = r.id
+            continue
+        count, last_seen = totals[owner]
+        seen = min(as_utc(r.last_seen or r.timestamp), bucket_end)
+        totals[owner] = (count + (r.sample_count or 1), max(last_seen, seen))
+        absorbed.add(owner)
+    dropped = [r.id for r in rows if r.id not in keep]
+    return dropped, {row_id: totals[row_id] for row_id in absorbed}
+
+
+def compact_history(product_ids, resolution, start, end) -> int:
+    """
+    Compact the products' history runs that started in [start, end) to
+    per-`resolution` representatives. Runs in the caller's transaction;
+    the caller commits. Returns the number of rows deleted.
+    """
+    query = select(
+        PriceHistory.id,
+        PriceHistory.product_id,
+        PriceHistory.timestamp,
+        PriceHistory.last_seen,
+        PriceHistory.sample_count,
+        PriceHistory.promo_price,
+        PriceHistory.regular_price,
+    ).where(PriceHistory.product_id.in_(product_ids), PriceHistory.timestamp < end)
+    if start is not None:
+        query = query.where(PriceHistory.timestamp >= start)
+    rows = db.session.execute(
+        query.order_by(PriceHistory.product_id, PriceHistory.timestamp, PriceHistory.id)
+    ).all()
+
+    latest = {row_id for row_id, _, _ in _latest_runs(list(product_ids)).values()}
+    deleted, kept = [], []
+    for (_, start_of_bucket), bucket in itertools.groupby(
+        rows,
+        key=lambda r: (r.product_id, bucket_start(as_utc(r.timestamp), resolution)),
+    ):
+        bucket = list(bucket)
+        if len(bucket) <= 2:
+            continue
+        dropped, totals = _compact_bucket(
+            bucket, start_of_bucket + BUCKET_LENGTHS[resolution], latest
+        )
+        deleted.extend(dropped)
+        kept.extend(
+            {"id": row_id, "sample_count": count, "last_seen": last_seen}
+            for row_id, (count, last_seen) in totals.items()
+        )
+
+    for i in range(0, len(deleted), COMPACT_DELETE_CHUNK):
+        db.session.execute(
+            delete(PriceHistory)
+            .where(PriceHistory.id.in_(deleted[i : i + COMPACT_DELETE_CHUNK]))
+            .execution_options(synchronize_session=False)
+        )
+    if kept:
+        db.session.execute(update(PriceHistory), kept)
+    return len(deleted)
+
+
+def _compact_tier(resolution, cutoff, batch_size, max_batches) -> tuple:
+    """
+    Continue this resolution's compaction pass for up to `max_batches`
+    batches of products. Returns (rows deleted, batches used).
+    """
+    state = db.session.get(HistoryCompaction, resolution)
+    if state is None:
+        state = HistoryCompaction(resolution=resolution)
+        db.session.add(state)
+    if state.pass_until is None:
+        if state.compacted_until and as_utc(state.compacted_until) >= cutoff:
+            return 0, 0
+        state.pass_until = cutoff
+        state.next_product_id = ""
+        db.session.commit()
+
+    deleted = batches = 0
+    while batches < max_batches:
+        ids = (
+            db.session.execute(
+                select(Product.id)
+                .where(Product.id > state.next_product_id)
+                .order_by(Product.id)
+                .limit(batch_size)
+            )
+            .scalars()
+            .all()
+        )
+        if not ids:
+            state.compacted_until = state.pass_until
+            state.pass_until = None
+            state.next_product_id = None
+            db.session.commit()
+            break
+        deleted += db_writer.run(
+            compact_history,
+            ids,
+            resolution,
+            state.compacted_until,
+            state.pass_until,
+        )
+        state.next_product_id = ids[-1]
+        db.session.commit()
+        batches += 1
+    return deleted, batches
+
+
+def _incremental_vacuum(pages) -> int:
+    """
+    Return up to `pages` free SQLite pages to the filesystem, if the
+    database uses incremental auto-vacuum. Returns the number of pages.
+    """
+    connection = db.engine.raw_connection()
+    try:
+        driver_connection = connection.driver_connection
+        mode = driver_connection.execute("PRAGMA auto_vacuum").fetchone()[0]
+        # Databases created before auto_vacuum was set stay at NONE, where
+        # the pragma does nothing
+        if mode != SQLITE_AUTO_VACUUM_INCREMENTAL:
+            return 0
+        free = driver_connection.execute("PRAGMA freelist_count").fetchone()[0]
+        pages = min(pages, free)
+        if pages:
+            # The pragma frees a page per step, and execute() steps a
+            # statement without result columns only once; a script steps it
+            # to the end. A script also commits first, so this runs on its
+            # own connection rather than in the writer's transaction.
+            driver_connection.executescript(f"PRAGMA incremental_vacuum({pages})")
+        return pages
+    finally:
+        connection.close()
+
+
+def compact_price_history(app):
+    """
+    Scheduled job: downsample old price history in small batches.
+
+    Runs older than HISTORY_RAW_DAYS are reduced to hourly representatives
+    keeping each hour's lowest and highest prices, and runs older than
+    HISTORY_HOURLY_DAYS to daily ones. Each batch of products is its own
+    transaction on the database writer, so polling writes interleave with
+    compaction. Passes resume where the last run stopped. On SQLite
+    databases with incremental auto-vacuum, up to HISTORY_VACUUM_PAGES
+    freed pages are then returned to the filesystem.
+    """
+    with app.app_context():
+        config = app.config
+        interval = config.get(
+            "HISTORY_COMPACT_INTERVAL_MINUTES", DEFAULT_HISTORY_COMPACT_INTERVAL_MINUTES
+        )
+        if not acquire_lease(COMPACTION_LEASE, interval * 60):
+            return
+        now = datetime.now(timezone.utc)
+        raw_days = config.get("HISTORY_RAW_DAYS", DEFAULT_HISTORY_RAW_DAYS)
+        hourly_days = max(
+            config.get("HISTORY_HOURLY_DAYS", DEFAULT_HISTORY_HOURLY_DAYS), raw_days
+        )
+        batch_size = config.get("HISTORY_COMPACT_BATCH", DEFAULT_HISTORY_COMPACT_BATCH)
+        budget = config.get(
+            "HISTORY_COMPACT_MAX_BATCHES", DEFAULT_HISTORY_COMPACT_MAX_BATCHES
+        )
+
+        deleted = 0
+        for resolution, days in (("hour", raw_days), ("day", hourly_days)):
+            # Whole buckets only, so a bucket is never compacted half-filled
+            cutoff = bucket_start(now - timedelta(days=days), resolution)
+            rows, used = _compact_tier(resolution, cutoff, batch_size, budget)
+            deleted += rows
+            budget -= used
+            if budget <= 0:
+                break
+
+        vacuumed = 0
+        if db.engine.dialect.name == "sqlite":
+            vacuumed = _incremental_vacuum(
+                config.get("HISTORY_VACUUM_PAGES", DEFAULT_HISTORY_VACUUM_PAGES)
+            )
+        logger.info(
+            f"✅ Compacted price history, removed {deleted} rows, "
+            f"freed {vacuumed} pages"
+        )
@@ -0,0 +1,135 @@
+import logging
+from datetime import timedelta
+from sqlalchemy import insert, update
+from ..models import PriceRollup, db
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = ("hour", "day", "week")
+
+# Product IDs per IN (...) clause when loading buckets
+ROLLUP_QUERY_CHUNK = 500
+
+
+def bucket_start(ts, resolution):
+    """Start of the hour, day or (Monday-based) week containing `ts`."""
+    if resolution == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        return day
+    if resolution == "week":
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"Unknown resolution: {resolution}")
+
+
+def update_rollups(samples: dict, ts):
+    """
+    Fold one poll's prices into the hourly, daily and weekly buckets.
+
+    Args:
+        samples: Product ID -> (promo_price, regular_price) polled at `ts`
+        ts: Poll timestamp
+
+    Runs in the caller's transaction; the caller commits.
+    """
+    ids = list(samples)
+    for resolution in RESOLUTIONS:
+        start = bucket_start(ts, resolution)
+        existing = {}
+        for i in range(0, len(ids), ROLLUP_QUERY_CHUNK):
+            rows = PriceRollup.query.filter(
+                PriceRollup.resolution == resolution,
+                PriceRollup.bucket_start == start,
+                PriceRollup.product_id.in_(ids[i : i + ROLLUP_QUERY_CHUNK]),
+            )
+            existing.update({r.product_id: r for r in rows})
+
+        new_rows, updated_rows = [], []
+        for pid, (promo, regular) in samples.items():
+            r = existing.get(pid)
+            if r is None:
+                new_rows.append(
+                    {
+                        "product_id": pid,
+                        "resolution": resolution,
+                        "bucket_start": start,
+                        "promo_open": promo,
+                        "promo_high": promo,
+                        "promo_low": promo,
+                        "promo_close": promo,
+                        "promo_sum": promo,
+                        "regular_open": regular,
+                        "regular_high": regular,
+                        "regular_low": regular,
+                        "regular_close": regular,
+                        "regular_sum": regular,
+                        "sample_count": 1,
+                    }
+                )
+                continue
+            updated_rows.append(
+                {
+                    "id": r.id,
+                    "promo_high": max(r.promo_high, promo),
+                    "promo_low": min(r.promo_low, promo),
+                    "promo_close": promo,
+                    "promo_sum": r.promo_sum + promo,
+                    "regular_high": max(r.regular_high, regular),
+                    "regular_low": min(r.regular_low, regular),
+                    "regular_close": regular,
+                    "regular_sum": r.regular_sum + regular,
+                    "sample_count": r.sample_count + 1,
+                }
+            )
+
+        if new_rows:
+            db.session.execute(insert(PriceRollup), new_rows)
+        if updated_rows:
+            db.session.execute(update(PriceRollup), updated_rows)
+
+
+def query_rollups(product_id, resolution, since=None, until=None, limit=500) -> list:
+    """A product's buckets at one resolution, newest first."""
+    query = db.session.query(
+        PriceRollup.bucket_start,
+        PriceRollup.promo_open,
+        PriceRollup.promo_high,
+        PriceRollup.promo_low,
+        PriceRollup.promo_close,
+        PriceRollup.promo_sum,
+        PriceRollup.regular_open,
+        PriceRollup.regular_high,
+        PriceRollup.regular_low,
+        PriceRollup.regular_close,
+        PriceRollup.regular_sum,
+        PriceRollup.sample_count,
+    ).filter(PriceRollup.product_id == product_id, PriceRollup.resolution == resolution)
+    if since is not None:
+        query = query.filter(
+            PriceRollup.bucket_start >= bucket_start(since, resolution)
+        )
+    if until is not None:
+        query = query.filter(PriceRollup.bucket_start <= until)
+    return query.order_by(PriceRollup.bucket_start.desc()).limit(limit).all()
+
+
+def serialize_rollup(r) -> dict:
+    return {
+        "bucket_start": r.bucket_start.isoformat(),
+        "samples": r.sample_count,
+        "promo": {
+            "open": r.promo_open,
+            "high": r.promo_high,
+            "low": r.promo_low,
+            "close": r.promo_close,
+            "avg": r.promo_sum / r.sample_count,
+        },
+        "regular": {
+            "open": r.regular_open,
+            "high": r.regular_high,
+            "low": r.regular_low,
+            "close": r.regular_close,
+            "avg": r.regular_sum / r.sample_count,
+        },
+    }
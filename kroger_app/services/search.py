@@ -0,0 +1,253 @@
+import re
+import logging
+from flask import current_app
+from sqlalchemy import and_, func, literal_column, or_, select, text
+from ..models import Product, db
+from .kroger_api import PRODUCTS_PAGE_LIMIT, get_access_token, iter_products
+from .locations import resolve_location
+from ..storage import db_writer
+from .products import map_kroger_to_zenday, upsert_products
+
+logger = logging.getLogger(__name__)
+
+# Relevance weights for name, brand and category matches
+SEARCH_WEIGHTS = (10.0, 5.0, 2.0)
+# Searches with fewer local hits than this (or than the limit, if lower)
+# also go to the Kroger API
+DEFAULT_SEARCH_MIN_LOCAL_HITS = 5
+
+# FTS5 index over products, kept in sync by triggers so every write path
+# (bulk upserts included) updates it. products has a string key and only
+# an implicit rowid, which VACUUM may renumber, so index rows are keyed
+# through products_search_keys, whose INTEGER PRIMARY KEY is stable.
+PRODUCTS_FTS_DDL = [
+    """
+    CREATE TABLE products_search_keys (
+        id INTEGER PRIMARY KEY,
+        product_id VARCHAR NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, brand, category,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    INSERT INTO products_search_keys (product_id) SELECT id FROM products
+    """,
+    """
+    INSERT INTO products_fts (rowid, name, brand, category)
+    SELECT k.id, p.name, p.brand, p.category
+    FROM products p JOIN products_search_keys k ON k.product_id = p.id
+    """,
+    """
+    CREATE TRIGGER products_fts_insert AFTER INSERT ON products
+    BEGIN
+        INSERT INTO products_search_keys (product_id) VALUES (new.id);
+        INSERT INTO products_fts (rowid, name, brand, category)
+        VALUES (
+            (SELECT id FROM products_search_keys WHERE product_id = new.id),
+            new.name, new.brand, new.category
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_delete AFTER DELETE ON products
+    BEGIN
+        DELETE FROM products_fts WHERE rowid =
+            (SELECT id FROM products_search_keys WHERE product_id = old.id);
+        DELETE FROM products_search_keys WHERE product_id = old.id;
+    END
+    """,
+    # Price polls rewrite these columns unchanged; only reindex real changes
+    """
+    CREATE TRIGGER products_fts_update
+    AFTER UPDATE OF name, brand, category ON products
+    WHEN old.name IS NOT new.name OR old.brand IS NOT new.brand
+        OR old.category IS NOT new.category
+    BEGIN
+        UPDATE products_fts
+        SET name = new.name, brand = new.brand, category = new.category
+        WHERE rowid =
+            (SELECT id FROM products_search_keys WHERE product_id = new.id);
+    END
+    """,
+]
+# Objects of the earlier index, keyed on products' rowid
+LEGACY_FTS_DDL = [
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    "DROP TABLE IF EXISTS products_fts",
+]
+
+# On PostgreSQL, a GIN index over this expression; queries must repeat it
+# exactly for the index to be used
+PRODUCTS_SEARCH_DOCUMENT = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || "
+    "coalesce(brand, '') || ' ' || coalesce(category, ''))"
+)
+PRODUCTS_SEARCH_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_products_search "
+    f"ON products USING GIN (({PRODUCTS_SEARCH_DOCUMENT}))"
+)
+
+
+def create_search_index(app) -> str:
+    """
+    Create the local product search index if missing, filling it from the
+    products already stored: FTS5 on SQLite, a GIN full-text index on
+    PostgreSQL, and none elsewhere, where searches use LIKE. Sets and
+    returns PRODUCT_SEARCH_BACKEND ("fts5", "tsvector" or "like").
+    """
+    dialect = db.engine.dialect.name
+    backend = "like"
+    if dialect == "sqlite":
+        try:
+            with db.engine.begin() as conn:
+                exists = conn.execute(
+                    text(
+                        "SELECT 1 FROM sqlite_master "
+                        "WHERE type = 'table' AND name = 'products_search_keys'"
+                    )
+                ).first()
+                if not exists:
+                    for statement in LEGACY_FTS_DDL + PRODUCTS_FTS_DDL:
+                        conn.execute(text(statement))
+                    logger.info("Built products_fts search index")
+            backend = "fts5"
+        except Exception as e:
+            logger.warning(f"⚠️  FTS5 unavailable, searching with LIKE: {e}")
+    elif dialect == "postgresql":
+        with db.engine.begin() as conn:
+            conn.execute(text(PRODUCTS_SEARCH_INDEX_DDL))
+        backend = "tsvector"
+    app.config["PRODUCT_SEARCH_BACKEND"] = backend
+    return backend
+
+
+def search_terms(term: str) -> list:
+    """Lowercased word tokens of a search term."""
+    return re.findall(r"\w+", (term or "").lower())
+
+
+def _ranked_ids(terms, limit) -> list:
+    backend = current_app.config.get("PRODUCT_SEARCH_BACKEND", "like")
+    if backend == "fts5":
+        # Every term must match, each as a prefix
+        match = " ".join(f'"{t}"*' for t in terms)
+        weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+        return (
+            db.session.execute(
+                text(
+                    "SELECT k.product_id FROM products_fts "
+                    "JOIN products_search_keys k ON k.id = products_fts.rowid "
+                    "WHERE products_fts MATCH :match "
+                    f"ORDER BY bm25(products_fts, {weights}) LIMIT :limit"
+                ),
+                {"match": match, "limit": limit},
+            )
+            .scalars()
+            .all()
+        )
+    if backend == "tsvector":
+        query = func.to_tsquery("simple", " & ".join(f"{t}:*" for t in terms))
+        document = literal_column(PRODUCTS_SEARCH_DOCUMENT)
+        return (
+            db.session.execute(
+                select(Product.id)
+                .where(document.op("@@")(query))
+                .order_by(func.ts_rank(document, query).desc(), Product.id)
+                .limit(limit)
+            )
+            .scalars()
+            .all()
+        )
+    conditions = [
+        or_(
+            Product.name.ilike(f"%{t}%"),
+            Product.brand.ilike(f"%{t}%"),
+            Product.category.ilike(f"%{t}%"),
+        )
+        for t in terms
+    ]
+    return (
+        db.session.execute(
+            select(Product.id)
+            .where(and_(*conditions))
+            .order_by(Product.name, Product.id)
+            .limit(limit)
+        )
+        .scalars()
+        .all()
+    )
+
+
+def search_products(term: str, limit: int = 20) -> list:
+    """
+    Find stored products whose name, brand or category contain every word
+    of `term` (as a prefix, with the full-text backends), best matches
+    first. Returns Product rows.
+    """
+    terms = search_terms(term)
+    if not terms:
+        return []
+    return _products_by_id(_ranked_ids(terms, limit))
+
+
+def _products_by_id(ids) -> list:
+    if not ids:
+        return []
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(ids))}
+    return [products[pid] for pid in ids if pid in products]
+
+
+def _fetch_and_store(term, limit) -> list:
+    """
+    Search the Kroger API at the polling store and store the priced
+    results. Search responses may be cached, so no price samples are
+    recorded; only polls do that. Returns the IDs found, in Kroger's order.
+    """
+    token = get_access_token()
+    loc = resolve_location(token, current_app.config.get("POLL_ZIP_CODE", "45202"))
+    # One page is enough to fill the results; don't spend quota on more
+    items = list(
+        iter_products(
+            token,
+            term,
+            min(limit, PRODUCTS_PAGE_LIMIT),
+            loc.get("locationId"),
+            max_items=limit,
+            prefetch=False,
+        )
+    )
+    mapped = [map_kroger_to_zenday(item) for item in items]
+    priced = [m for m in mapped if m["id"] and m["price"]["regular"] is not None]
+    if priced:
+        db_writer.run(upsert_products, priced)
+    return [m["id"] for m in priced]
+
+
+def find_products(term: str, limit: int = 20) -> tuple:
+    """
+    Search stored products first, and the Kroger API only when fewer than
+    SEARCH_MIN_LOCAL_HITS are found locally. Products found upstream are
+    stored, so the same search is local next time.
+
+    Returns (products, source) with source "local" or "kroger". If the API
+    call fails, the local hits are returned.
+    """
+    products = search_products(term, limit)
+    min_hits = current_app.config.get(
+        "SEARCH_MIN_LOCAL_HITS", DEFAULT_SEARCH_MIN_LOCAL_HITS
+    )
+    if len(products) >= min(min_hits, limit) or not search_terms(term):
+        return products, "local"
+    try:
+        fetched = _fetch_and_store(term, limit)
+    except Exception as e:
+        logger.error(f"Error searching Kroger for {term!r}: {e}")
+        return products, "local"
+    ids = list(dict.fromkeys([p.id for p in products] + fetched))[:limit]
+    return _products_by_id(ids), "kroger"
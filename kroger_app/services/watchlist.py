@@ -0,0 +1,221 @@
+import random
+import logging
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select
+from ..models import PriceHistory, WatchedProduct, db
+from ..utils import as_utc
+
+logger = logging.getLogger(__name__)
+
+# Products watched on a fresh database
+DEFAULT_WATCHED_IDS = ["0001111041700"]
+
+DEFAULT_POLL_INTERVAL_MINUTES = 10
+# Bounds for adapted intervals, and the history they are derived from
+DEFAULT_POLL_MIN_INTERVAL_MINUTES = 5
+DEFAULT_POLL_MAX_INTERVAL_MINUTES = 24 * 60
+DEFAULT_POLL_VOLATILITY_DAYS = 7
+# Polls aimed for between two price changes of a product
+POLL_SAMPLES_PER_CHANGE = 4
+# Product IDs per IN (...) clause when counting price changes
+VOLATILITY_QUERY_CHUNK = 500
+
+
+def _default_interval():
+    return current_app.config.get(
+        "POLL_INTERVAL_MINUTES", DEFAULT_POLL_INTERVAL_MINUTES
+    )
+
+
+def add_to_watchlist(product_id: str, poll_interval_minutes: int = None) -> dict:
+    """
+    Start watching a product. It is due immediately. An explicit interval
+    is pinned; otherwise the interval adapts to how often the price changes,
+    and re-adding a watched product keeps its current interval.
+    """
+    now = datetime.now(timezone.utc)
+    entry = db.session.get(WatchedProduct, product_id)
+    if not entry:
+        entry = WatchedProduct(
+            product_id=product_id,
+            poll_interval_minutes=_default_interval(),
+            interval_pinned=False,
+        )
+        db.session.add(entry)
+    if poll_interval_minutes:
+        entry.poll_interval_minutes = poll_interval_minutes
+        entry.interval_pinned = True
+    entry.next_due_at = now
+    db.session.commit()
+    logger.info(f"👀 Watching {product_id} every {entry.poll_interval_minutes} min")
+    return serialize_watched_product(entry)
+
+
+def remove_from_watchlist(product_id: str) -> bool:
+    entry = db.session.get(WatchedProduct, product_id)
+    if not entry:
+        return False
+    db.session.delete(entry)
+    db.session.commit()
+    logger.info(f"Stopped watching {product_id}")
+    return True
+
+
+def seed_watchlist(product_ids=DEFAULT_WATCHED_IDS):
+    """
+    Populate an empty watchlist. First polls are spread randomly over one
+    interval so seeded products do not all come due on the same tick.
+    """
+    if db.session.query(WatchedProduct.product_id).first():
+        return
+    interval = _default_interval()
+    now = datetime.now(timezone.utc)
+    for pid in product_ids:
+        db.session.add(
+            WatchedProduct(
+                product_id=pid,
+                poll_interval_minutes=interval,
+                next_due_at=now + timedelta(seconds=random.uniform(0, interval * 60)),
+            )
+        )
+    db.session.commit()
+
+
+def has_due_products() -> bool:
+    now = datetime.now(timezone.utc)
+    return (
+        db.session.query(WatchedProduct.product_id)
+        .filter(WatchedProduct.next_due_at <= now)
+        .first()
+        is not None
+    )
+
+
+def claim_due_products(limit: int) -> list:
+    """
+    Claim up to `limit` products whose poll is due, oldest first. Claimed
+    products are rescheduled one interval from now before being returned,
+    so a later tick will not pick them up again.
+    """
+    now = datetime.now(timezone.utc)
+    due = (
+        WatchedProduct.query.filter(WatchedProduct.next_due_at <= now)
+        .order_by(WatchedProduct.next_due_at)
+        .limit(limit)
+        .all()
+    )
+    for entry in due:
+        entry.last_polled_at = now
+        entry.next_due_at = now + timedelta(minutes=entry.poll_interval_minutes)
+    db.session.commit()
+    return [entry.product_id for entry in due]
+
+
+def price_change_stats(product_ids, since) -> dict:
+    """
+    Count each product's price changes since `since` with one grouped query
+    per VOLATILITY_QUERY_CHUNK products. Works whether history stores runs
+    or every poll, by comparing each row with the one before it.
+
+    Returns product ID -> (changes, first observation in the window).
+    """
+    stats = {}
+    for i in range(0, len(product_ids), VOLATILITY_QUERY_CHUNK):
+        order = PriceHistory.timestamp, PriceHistory.id
+        rows = (
+            select(
+                PriceHistory.product_id,
+                PriceHistory.timestamp,
+                PriceHistory.promo_price,
+                PriceHistory.regular_price,
+                func.lag(PriceHistory.promo_price)
+                .over(partition_by=PriceHistory.product_id, order_by=order)
+                .label("prev_promo"),
+                func.lag(PriceHistory.regular_price)
+                .over(partition_by=PriceHistory.product_id, order_by=order)
+                .label("prev_regular"),
+            )
+            .where(
+                PriceHistory.product_id.in_(
+                    product_ids[i : i + VOLATILITY_QUERY_CHUNK]
+                ),
+                func.coalesce(PriceHistory.last_seen, PriceHistory.timestamp) >= since,
+            )
+            .subquery()
+        )
+        changed = and_(
+            rows.c.timestamp >= since,
+            rows.c.prev_promo.isnot(None),
+            or_(
+                rows.c.promo_price != rows.c.prev_promo,
+                rows.c.regular_price != rows.c.prev_regular,
+            ),
+        )
+        query = select(
+            rows.c.product_id,
+            func.sum(case((changed, 1), else_=0)),
+            func.min(rows.c.timestamp),
+        ).group_by(rows.c.product_id)
+        for pid, changes, first_seen in db.session.execute(query):
+            stats[pid] = (changes, first_seen)
+    return stats
+
+
+def adapt_poll_intervals(product_ids) -> None:
+    """
+    Set the poll interval of just-polled products from their recent price
+    change rate, aiming for POLL_SAMPLES_PER_CHANGE polls between changes,
+    within POLL_MIN/MAX_INTERVAL_MINUTES. Products seen for less than the
+    volatility window are judged on the history they have, and a product
+    with no change is treated as if one were about to happen, so intervals
+    grow gradually from POLL_INTERVAL_MINUTES. Pinned intervals are left
+    alone.
+    """
+    config = current_app.config
+    if not config.get("POLL_ADAPTIVE", True):
+        return
+    low = config.get("POLL_MIN_INTERVAL_MINUTES", DEFAULT_POLL_MIN_INTERVAL_MINUTES)
+    high = config.get("POLL_MAX_INTERVAL_MINUTES", DEFAULT_POLL_MAX_INTERVAL_MINUTES)
+    days = config.get("POLL_VOLATILITY_DAYS", DEFAULT_POLL_VOLATILITY_DAYS)
+
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(days=days)
+    entries = []
+    for i in range(0, len(product_ids), VOLATILITY_QUERY_CHUNK):
+        entries.extend(
+            WatchedProduct.query.filter(
+                WatchedProduct.product_id.in_(
+                    product_ids[i : i + VOLATILITY_QUERY_CHUNK]
+                ),
+                WatchedProduct.interval_pinned.isnot(True),
+            )
+        )
+    stats = price_change_stats([e.product_id for e in entries], since)
+    for entry in entries:
+        if entry.product_id not in stats:
+            continue
+        changes, first_seen = stats[entry.product_id]
+        observed = (now - max(as_utc(first_seen), since)).total_seconds() / 60
+        interval = observed / (max(changes, 1) * POLL_SAMPLES_PER_CHANGE)
+        if not changes:
+            interval = max(interval, _default_interval())
+        interval = int(min(max(interval, low), high))
+        if interval != entry.poll_interval_minutes:
+            entry.poll_interval_minutes = interval
+            entry.next_due_at = as_utc(entry.last_polled_at or now) + timedelta(
+                minutes=interval
+            )
+    db.session.commit()
+
+
+def serialize_watched_product(entry: WatchedProduct) -> dict:
+    return {
+        "product_id": entry.product_id,
+        "poll_interval_minutes": entry.poll_interval_minutes,
+        "interval_pinned": bool(entry.interval_pinned),
+        "next_due_at": entry.next_due_at.isoformat() if entry.next_due_at else None,
+        "last_polled_at": (
+            entry.last_polled_at.isoformat() if entry.last_polled_at else None
+        ),
+    }
@@ -0,0 +1,339 @@
+import io
+import os
+import csv
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from sqlalchemy import event, insert, text
+from .models import PriceHistory, db
+from .services.leases import acquire_lease
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_URI = "sqlite:///kroger.db"
+
+# Seconds a SQLite connection waits for the write lock before failing
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+
+# Applied to every new SQLite connection. WAL lets readers run alongside
+# the writer; NORMAL sync is durable across app crashes and only risks
+# the last commits on power loss. Incremental auto-vacuum lets compaction
+# hand freed pages back a few at a time; it only takes effect on databases
+# created with it (or after a one-off VACUUM).
+SQLITE_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # Matches the driver's own timeout, which this pragma would override
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_SECONDS * 1000,
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+# Most queued writes committed together in one transaction
+DEFAULT_WRITE_GROUP_MAX = 64
+
+# On PostgreSQL, price_history is partitioned by month. Its primary key has
+# to include the partition key, which SQLite cannot autoincrement, so the
+# table is created here rather than from the model.
+PARTITIONED_HISTORY_DDL = """
+CREATE TABLE IF NOT EXISTS price_history (
+    id BIGSERIAL,
+    product_id VARCHAR NOT NULL REFERENCES products (id),
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    promo_price DOUBLE PRECISION NOT NULL,
+    regular_price DOUBLE PRECISION NOT NULL,
+    last_seen TIMESTAMP WITH TIME ZONE,
+    sample_count INTEGER,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS price_history_default
+    PARTITION OF price_history DEFAULT;
+"""
+# Monthly partitions created ahead of the current month
+HISTORY_PARTITIONS_AHEAD = 2
+# The partition job runs this often, in one process at a time
+PARTITION_JOB_HOURS = 6
+PARTITION_LEASE = "kroger_partition_job"
+# Columns written by COPY, in order
+HISTORY_COPY_COLUMNS = (
+    "product_id",
+    "timestamp",
+    "last_seen",
+    "sample_count",
+    "promo_price",
+    "regular_price",
+)
+
+
+def configure_storage(app):
+    """
+    Set the database URI and engine options on `app`. Call before
+    `db.init_app(app)`, then call `init_storage(app)` after it.
+    """
+    uri = os.getenv("DATABASE_URL", DEFAULT_DATABASE_URI)
+    if uri.startswith("postgres://"):
+        # Heroku-style URLs; SQLAlchemy only accepts "postgresql"
+        uri = "postgresql://" + uri[len("postgres://") :]
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    if uri.startswith("sqlite"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_SECONDS},
+        }
+    else:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "pool_pre_ping": True,
+            "pool_size": int(os.getenv("DB_POOL_SIZE", 10)),
+        }
+    # Monthly history partitions older than this are dropped on PostgreSQL;
+    # 0 keeps them all
+    app.config["HISTORY_PARTITION_RETENTION_MONTHS"] = int(
+        os.getenv("HISTORY_PARTITION_RETENTION_MONTHS", 0)
+    )
+    app.config["SQLITE_PRAGMAS"] = dict(SQLITE_PRAGMAS)
+    app.config["DB_WRITE_GROUP_MAX"] = int(
+        os.getenv("DB_WRITE_GROUP_MAX", DEFAULT_WRITE_GROUP_MAX)
+    )
+
+
+def init_storage(app):
+    """Apply SQLITE_PRAGMAS to the app's SQLite engines and start the writer."""
+    pragmas = app.config.get("SQLITE_PRAGMAS", SQLITE_PRAGMAS)
+
+    def set_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", set_pragmas)
+    db_writer.init_app(app)
+
+
+def is_postgres() -> bool:
+    return db.engine.dialect.name == "postgresql"
+
+
+def create_schema():
+    """
+    Create missing tables. On PostgreSQL, price_history is created as a
+    monthly range-partitioned table with partitions for the coming months.
+    """
+    if not is_postgres():
+        db.create_all()
+        return
+    history = PriceHistory.__table__
+    db.metadata.create_all(
+        db.engine, tables=[t for t in db.metadata.sorted_tables if t is not history]
+    )
+    with db.engine.begin() as conn:
+        conn.execute(text(PARTITIONED_HISTORY_DDL))
+        for index in history.indexes:
+            index.create(bind=conn, checkfirst=True)
+    ensure_history_partitions()
+
+
+def _month_start(year, month):
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def _partition_name(start):
+    return f"price_history_y{start.year}m{start.month:02d}"
+
+
+def ensure_history_partitions(now=None, ahead=HISTORY_PARTITIONS_AHEAD):
+    """Create the monthly price_history partitions from this month to `ahead` months on."""
+    if not is_postgres():
+        return
+    now = now or datetime.now(timezone.utc)
+    for offset in range(ahead + 1):
+        start = _month_start(now.year, now.month + offset)
+        end = _month_start(start.year, start.month + 1)
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {_partition_name(start)} "
+                        f"PARTITION OF price_history "
+                        f"FOR VALUES FROM ('{start.isoformat()}') "
+                        f"TO ('{end.isoformat()}')"
+                    )
+                )
+        except Exception as e:
+            # Rows for that month already landed in the default partition
+            logger.warning(f"⚠️  Could not create {_partition_name(start)}: {e}")
+
+
+def drop_history_partitions(retention_months, now=None) -> list:
+    """
+    Drop monthly price_history partitions that end more than
+    `retention_months` months ago. Dropping a partition is a cheap catalog
+    change, unlike deleting its rows. Returns the dropped partition names.
+    """
+    if not is_postgres():
+        return []
+    now = now or datetime.now(timezone.utc)
+    cutoff = _month_start(now.year, now.month - retention_months)
+    rows = db.session.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'price_history'"
+        )
+    ).scalars()
+    dropped = []
+    for name in rows:
+        if not name.startswith("price_history_y"):
+            continue
+        year, month = int(name[15:19]), int(name[20:22])
+        if _month_start(year, month + 1) <= cutoff:
+            dropped.append(name)
+    for name in dropped:
+        db.session.execute(text(f"DROP TABLE {name}"))
+        logger.info(f"Dropped history partition {name}")
+    db.session.commit()
+    return dropped
+
+
+def maintain_history_partitions(app):
+    """Scheduled job: keep future partitions ready and drop expired ones."""
+    with app.app_context():
+        if not acquire_lease(PARTITION_LEASE, PARTITION_JOB_HOURS * 3600):
+            return
+        ensure_history_partitions()
+        retention = app.config.get("HISTORY_PARTITION_RETENTION_MONTHS")
+        if retention:
+            drop_history_partitions(retention)
+
+
+def _copy_history(rows) -> bool:
+    """COPY history rows in the session's transaction; False if the driver can't."""
+    dbapi_connection = db.session.connection().connection.driver_connection
+    driver = db.engine.dialect.driver
+    columns = ", ".join(HISTORY_COPY_COLUMNS)
+    sql = f"COPY price_history ({columns}) FROM STDIN WITH (FORMAT csv)"
+    values = [[row.get(c) for c in HISTORY_COPY_COLUMNS] for row in rows]
+    if driver == "psycopg2":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in values:
+            writer.writerow(
+                [
+                    "" if v is None else v.isoformat() if isinstance(v, datetime) else v
+                    for v in row
+                ]
+            )
+        buffer.seek(0)
+        with dbapi_connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+        return True
+    if driver == "psycopg":
+        with dbapi_connection.cursor() as cursor:
+            with cursor.copy(sql.replace(" WITH (FORMAT csv)", "")) as copy:
+                for row in values:
+                    copy.write_row(row)
+        return True
+    return False
+
+
+def insert_history(rows):
+    """
+    Append price_history rows in the session's transaction, with COPY on
+    PostgreSQL and a bulk INSERT elsewhere.
+    """
+    if not rows:
+        return
+    if is_postgres() and _copy_history(rows):
+        return
+    db.session.execute(insert(PriceHistory), rows)
+
+
+class DatabaseWriter:
+    """
+    Runs database writes on one dedicated thread.
+
+    Jobs are functions that write through `db.session` without committing.
+    Whatever has queued up while the previous group ran, up to
+    DB_WRITE_GROUP_MAX jobs, runs in one transaction with one commit. If a
+    group fails it is rolled back and each job is retried on its own, so
+    one bad job only fails its own caller.
+    """
+
+    def __init__(self):
+        self._app = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue a write job; the future resolves once it is committed."""
+        if threading.current_thread() is self._thread:
+            # Already on the writer, inside the caller's group
+            future = Future()
+            future.set_result(fn(*args, **kwargs))
+            return future
+        self._ensure_started()
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Queue a write job and wait for its result."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _ensure_started(self):
+        with self._lock:
+            # A forked worker inherits the attribute but not the thread
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name="db-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            jobs = [self._queue.get()]
+            group_max = self._app.config.get(
+                "DB_WRITE_GROUP_MAX", DEFAULT_WRITE_GROUP_MAX
+            )
+            while len(jobs) < group_max:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._app.app_context():
+                self._run_group(jobs)
+
+    def _run_group(self, jobs):
+        results = []
+        try:
+            for fn, args, kwargs, _ in jobs:
+                results.append(fn(*args, **kwargs))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(jobs) == 1:
+                jobs[0][3].set_exception(e)
+                return
+            logger.warning(
+                f"⚠️  Write group of {len(jobs)} failed ({e}); retrying one by one"
+            )
+            for job in jobs:
+                self._run_group([job])
+            return
+        for (_, _, _, future), result in zip(jobs, results):
+            future.set_result(result)
+
+
+db_writer = DatabaseWriter()
@@ -1,4 +1,5 @@
 import json
+from datetime import timezone
 
 
 def save_token(token: str, path: str = "token.json"):
@@ -15,6 +16,13 @@ def get_saved_token(path: str = "token.json"):
         return None
 
 
+def as_utc(ts):
+    """Treat naive datetimes (as read back from SQLite) as UTC."""
+    if ts is not None and ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
 def handle_kroger_api_response(response, success_status_code=200, success_message=""):
     if response.status_code == success_status_code:
         return {"success": True, "message": success_message}
@@ -26,6 +34,8 @@ def handle_kroger_api_response(response, success_status_code=200, success_messag
         raise Exception(
             "Forbidden: Your token doesn't have the required cart.basic scope"
         )
+    elif response.status_code == 429:
+        raise Exception("Rate limited: Kroger API quota exhausted, try again later")
     else:
         raise Exception(f"Cart API error: {response.status_code} - {response.text}")
 
@@ -46,4 +56,6 @@ def handle_kroger_request_exception(e):
             )
         elif e.response.status_code == 404:
             raise Exception("Cart not found")
+        elif e.response.status_code == 429:
+            raise Exception("Rate limited: Kroger API quota exhausted, try again later")
     raise Exception(f"Cart API error: {str(e)}")
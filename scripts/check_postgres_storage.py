@@ -0,0 +1,166 @@
+"""
+Check the PostgreSQL-only storage code against a scratch database:
+the partitioned price_history DDL, COPY ingest through insert_history(),
+and partition dropping in drop_history_partitions().
+
+    DATABASE_URL=postgresql://user@host/scratch python scripts/check_postgres_storage.py
+
+Use postgresql+psycopg:// to check the psycopg 3 COPY path instead of
+psycopg2's. The database must be disposable: the script creates and drops
+history partitions and writes (then deletes) a test product.
+"""
+
+import os
+import sys
+import logging
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, select, text  # noqa: E402
+from kroger_app import create_app  # noqa: E402
+from kroger_app.models import PriceHistory, Product, db  # noqa: E402
+from kroger_app.storage import (  # noqa: E402
+    HISTORY_PARTITIONS_AHEAD,
+    _month_start,
+    _partition_name,
+    drop_history_partitions,
+    ensure_history_partitions,
+    insert_history,
+    is_postgres,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+TEST_PRODUCT_ID = "check-postgres-storage"
+
+
+def partitions() -> set:
+    return set(
+        db.session.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = 'price_history'"
+            )
+        ).scalars()
+    )
+
+
+def check_schema(now):
+    partitioned = db.session.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table t "
+            "JOIN pg_class c ON c.oid = t.partrelid "
+            "WHERE c.relname = 'price_history'"
+        )
+    ).first()
+    assert partitioned, "price_history is not a partitioned table"
+    expected = {"price_history_default"} | {
+        _partition_name(_month_start(now.year, now.month + offset))
+        for offset in range(HISTORY_PARTITIONS_AHEAD + 1)
+    }
+    missing = expected - partitions()
+    assert not missing, f"missing partitions: {sorted(missing)}"
+    logger.info("✅ price_history is partitioned by month")
+
+
+def check_copy(now):
+    db.session.merge(Product(id=TEST_PRODUCT_ID, name="Partition check"))
+    db.session.commit()
+    rows = [
+        {
+            "product_id": TEST_PRODUCT_ID,
+            "timestamp": now - timedelta(minutes=i),
+            # None must arrive as NULL, not as an empty string
+            "last_seen": None if i % 2 else now,
+            "sample_count": i + 1,
+            "promo_price": 1.25 + i,
+            "regular_price": 2.5 + i,
+        }
+        for i in range(3)
+    ]
+    insert_history(rows)
+    db.session.commit()
+
+    stored = db.session.execute(
+        select(
+            PriceHistory.timestamp,
+            PriceHistory.last_seen,
+            PriceHistory.sample_count,
+            PriceHistory.promo_price,
+            PriceHistory.regular_price,
+        )
+        .where(PriceHistory.product_id == TEST_PRODUCT_ID)
+        .order_by(PriceHistory.sample_count)
+    ).all()
+    expected = [
+        (
+            r["timestamp"],
+            r["last_seen"],
+            r["sample_count"],
+            r["promo_price"],
+            r["regular_price"],
+        )
+        for r in rows
+    ]
+    assert [tuple(r) for r in stored] == expected, f"COPY stored {stored}"
+    partition = db.session.execute(
+        text(
+            "SELECT DISTINCT tableoid::regclass::text FROM price_history "
+            "WHERE product_id = :pid"
+        ),
+        {"pid": TEST_PRODUCT_ID},
+    ).scalar_one()
+    assert partition == _partition_name(now), f"rows landed in {partition}"
+    # Partition DDL runs on its own connection and waits for our locks
+    db.session.commit()
+    logger.info(f"✅ COPY via {db.engine.dialect.driver} stored rows in {partition}")
+
+
+def check_drop(now):
+    old = _month_start(now.year, now.month - 24)
+    ensure_history_partitions(now=old, ahead=0)
+    assert _partition_name(old) in partitions(), "old partition was not created"
+
+    dropped = drop_history_partitions(12, now=now)
+    assert dropped == [_partition_name(old)], f"dropped {dropped}"
+    left = partitions()
+    assert "price_history_default" in left and _partition_name(now) in left
+    logger.info(f"✅ Dropped expired partition {dropped[0]} and kept the rest")
+
+
+def cleanup():
+    db.session.rollback()
+    db.session.execute(
+        delete(PriceHistory).where(PriceHistory.product_id == TEST_PRODUCT_ID)
+    )
+    db.session.execute(delete(Product).where(Product.id == TEST_PRODUCT_ID))
+    db.session.commit()
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        if not is_postgres():
+            logger.error("❌ DATABASE_URL must point to a scratch PostgreSQL database")
+            return 1
+        now = datetime.now(timezone.utc)
+        try:
+            check_schema(now)
+            check_copy(now)
+            check_drop(now)
+        finally:
+            cleanup()
+    logger.info("✅ PostgreSQL storage checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())